@@ -0,0 +1,151 @@
+"""Pose engines: run the pose model as an eager module, TorchScript or ONNX Runtime"""
+from abc import ABC, abstractmethod
+
+import numpy as np
+import torch
+
+from . import builder
+
+# ONNX Runtime is optional, it is only needed by the onnx backend
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+POSE_BACKENDS = ['eager', 'torchscript', 'onnx']
+
+
+class PoseEngine(ABC):
+    """Interface of the pose model used for inference"""
+    backend = None
+
+    @abstractmethod
+    def __call__(self, inps):
+        """
+        Run the pose model on a batch of crops(torch.FloatTensor,(n,3,h,w)),
+        return their heatmaps(torch.FloatTensor,(n,k,h',w')) on the device of the crops
+        """
+        pass
+
+    def eval(self):
+        return self
+
+
+class EagerEngine(PoseEngine):
+    """The `nn.Module` built by `builder.build_sppe`, possibly wrapped in `nn.DataParallel`"""
+    backend = 'eager'
+
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, inps):
+        return self.model(inps)
+
+    def eval(self):
+        self.model.eval()
+        return self
+
+
+class TorchScriptEngine(PoseEngine):
+    """A pose model exported by `export_torchscript`"""
+    backend = 'torchscript'
+
+    def __init__(self, path, device=torch.device('cpu')):
+        self.model = torch.jit.load(path, map_location=device)
+        self.model.eval()
+
+    def __call__(self, inps):
+        return self.model(inps)
+
+
+class ONNXEngine(PoseEngine):
+    """A pose model exported by `export_onnx`, run by ONNX Runtime on cpu"""
+    backend = 'onnx'
+
+    def __init__(self, path):
+        if onnxruntime is None:
+            raise ImportError('The onnx pose backend needs onnxruntime, install it with `pip install onnxruntime`')
+        self.session = onnxruntime.InferenceSession(path, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, inps):
+        inp = np.ascontiguousarray(inps.detach().cpu().numpy(), dtype=np.float32)
+        hm = self.session.run(None, {self.input_name: inp})[0]
+        return torch.from_numpy(hm).to(inps.device)
+
+
+def build_pose_engine(cfg, checkpoint, backend='eager', device=torch.device('cpu'), gpus=None):
+    """
+    Load the pose model for inference
+    Input: cfg: experiment config
+           checkpoint(str): weights of the eager model, or the model exported for the backend
+           backend(str): one of `POSE_BACKENDS`
+           device(torch.device): device of the model, the onnx backend always runs on cpu
+           gpus(list): gpu ids, the eager model is wrapped in `nn.DataParallel` on several gpus
+    Output: PoseEngine, in eval mode
+    """
+    if backend == 'eager':
+        model = builder.build_sppe(cfg.MODEL, preset_cfg=cfg.DATA_PRESET)
+        model.load_state_dict(torch.load(checkpoint, map_location=device))
+        if gpus is not None and len(gpus) > 1:
+            model = torch.nn.DataParallel(model, device_ids=gpus).to(device)
+        else:
+            model.to(device)
+        engine = EagerEngine(model)
+    elif backend == 'torchscript':
+        engine = TorchScriptEngine(checkpoint, device)
+    elif backend == 'onnx':
+        engine = ONNXEngine(checkpoint)
+    else:
+        raise NotImplementedError('Unknown pose backend: ' + backend)
+    return engine.eval()
+
+
+def _dummy_input(cfg, batch_size=2):
+    height, width = cfg.DATA_PRESET.IMAGE_SIZE
+    return torch.randn(batch_size, 3, height, width)
+
+
+def export_torchscript(model, cfg, path):
+    """
+    Trace an eager pose model, e.g. FastPose, FastPose_DUC, SimplePose or PoseHighResolutionNet,
+    to TorchScript. The models have no data dependent control flow, so the traced model runs on
+    any batch size. Models with deformable convolutions need the compiled extension to run.
+    """
+    model.eval()
+    with torch.no_grad():
+        traced = torch.jit.trace(model, _dummy_input(cfg))
+    traced.save(path)
+    return path
+
+
+def export_onnx(model, cfg, path, opset_version=11):
+    """
+    Export an eager pose model to ONNX, with a dynamic batch size. Deformable convolutions
+    have no ONNX operator, so models with DCN cannot be exported.
+    """
+    model.eval()
+    with torch.no_grad():
+        torch.onnx.export(
+            model, _dummy_input(cfg), path, opset_version=opset_version,
+            input_names=['input'], output_names=['heatmaps'],
+            dynamic_axes={'input': {0: 'batch'}, 'heatmaps': {0: 'batch'}})
+    return path
+
+
+def check_pose_engine(model, engine, cfg, batch_size=3, atol=1e-3):
+    """
+    Compare the heatmaps of an exported pose engine with the eager model on random crops,
+    on a batch size other than the one used for the export to check that the batch is dynamic
+    Output: maximum absolute difference, raises AssertionError above `atol`
+    """
+    model.eval()
+    inps = _dummy_input(cfg, batch_size)
+    with torch.no_grad():
+        expected = model(inps)
+        hm = engine(inps)
+    assert hm.shape == expected.shape, \
+        'Heatmaps of shape {} instead of {}'.format(tuple(hm.shape), tuple(expected.shape))
+    diff = (hm.float() - expected).abs().max().item()
+    assert diff <= atol, 'Heatmaps differ from the eager model by {:.2e} > {:.0e}'.format(diff, atol)
+    return diff
@@ -214,6 +214,17 @@ def _box_to_center_scale(x, y, w, h, aspect_ratio=1.0, scale_mult=1.25):
     return center, scale
 
 
+def _boxes_to_center_scale(boxes, aspect_ratio=1.0, scale_mult=1.25):
+    """Vectorized `_box_to_center_scale` of boxes (x1, y1, x2, y2) with shape (K, 4)."""
+    boxes = np.asarray(boxes, dtype=np.float32)
+    centers = (boxes[:, :2] + boxes[:, 2:4]) * 0.5
+    w = boxes[:, 2] - boxes[:, 0]
+    h = boxes[:, 3] - boxes[:, 1]
+    w, h = np.maximum(w, h * aspect_ratio), np.maximum(h, w / aspect_ratio)
+    scales = np.stack((w, h), 1) * np.where(centers[:, :1] != -1, scale_mult, 1).astype(np.float32)
+    return centers, scales
+
+
 def _center_scale_to_box(center, scale):
     pixel_std = 1.0
     w = scale[0] * pixel_std
@@ -226,7 +237,7 @@ def _center_scale_to_box(center, scale):
     return bbox
 
 
-def _clip_aspect_ratio(boxes, aspect_ratio=1.0):
+def _clip_aspect_ratio(boxes, aspect_ratio=1.0, scale_mult=1.0):
     xmin, ymin = boxes[:, 0], boxes[:, 1]
     xmax, ymax = boxes[:, 2], boxes[:, 3]
 
@@ -241,6 +252,8 @@ def _clip_aspect_ratio(boxes, aspect_ratio=1.0):
 
     idx = w < (aspect_ratio * h)
     w[idx] = h[idx] * aspect_ratio
+    w = w * scale_mult
+    h = h * scale_mult
 
     new_boxes = torch.zeros(boxes.shape[0], 5)
     new_boxes[:, 1] = c_x - w * 0.5
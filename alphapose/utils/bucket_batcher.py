@@ -0,0 +1,53 @@
+from collections import OrderedDict
+
+
+class BucketBatcher(object):
+    """Group the items of a stream into batches of items with the same key.
+
+    Used to batch images of the same detector input size together. Items are
+    added in input order and their positions are returned with the batches,
+    so that the input order can be restored after the batches are processed.
+    A bucket is released as soon as it holds `batch_size` items. To bound the
+    reordering, when more than `window` items are pending, the bucket holding
+    the oldest item is released as a partial batch.
+
+    Parameters
+    ----------
+    batch_size: int
+        Number of items of a full batch.
+    window: int
+        Maximum number of pending items, at least `batch_size`.
+    """
+
+    def __init__(self, batch_size, window):
+        self.batch_size = batch_size
+        self.window = max(window, batch_size)
+        # key -> list of (position, item), in order of their oldest item
+        self.buckets = OrderedDict()
+        self.num_pending = 0
+        self.num_items = 0
+
+    def add(self, key, item):
+        """Add the next item of the stream, return the list of batches released by it"""
+        bucket = self.buckets.setdefault(key, [])
+        bucket.append((self.num_items, item))
+        self.num_items += 1
+        self.num_pending += 1
+
+        batches = []
+        if len(bucket) == self.batch_size:
+            batches.append(self.release(key))
+        while self.num_pending > self.window:
+            # the first bucket holds the oldest item
+            batches.append(self.release(next(iter(self.buckets))))
+        return batches
+
+    def flush(self):
+        """Release all the pending items, at the end of the stream"""
+        return [self.release(key) for key in list(self.buckets)]
+
+    def release(self, key):
+        """Batch (key, positions, items) of the items of bucket `key`"""
+        bucket = self.buckets.pop(key)
+        self.num_pending -= len(bucket)
+        return key, [pos for pos, _ in bucket], [item for _, item in bucket]
@@ -0,0 +1,151 @@
+import hashlib
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+# one record of the index file per cached image, in least to most recently used order
+INDEX_DTYPE = np.dtype([('key', 'S16'), ('offset', '<i8'), ('rows', '<i4'), ('cols', '<i4')])
+
+
+class DetectionCache(object):
+    """On-disk cache of the detections of images, keyed by image content and detector settings.
+
+    The detections of an image are stored as a float32 array appended to a
+    data file, and an index file maps the key of each image to the position
+    of its array. Keys hash the image pixels together with the detector
+    settings, so reruns over the same images skip the detector, and changing
+    a setting never returns stale detections. When the arrays exceed
+    `max_size` bytes, the least recently used ones are dropped and the data
+    file is compacted. A cache directory should be used by one run at a time.
+
+    The files are opened lazily, so the cache can be pickled to the detection
+    worker in multi-process mode.
+
+    Parameters
+    ----------
+    root: str
+        Directory of the cache files, created if needed.
+    config: dict
+        Detector settings the detections depend on, e.g. weights and thresholds.
+    max_size: int
+        Maximum size of the cached detections in bytes.
+    flush_every: int
+        Write the index back to disk every this many new entries, in case the run is killed.
+    """
+    INDEX_FILE = 'index.bin'
+    DATA_FILE = 'dets.bin'
+
+    def __init__(self, root, config, max_size=1 << 30, flush_every=1024):
+        self.root = root
+        self.max_size = max_size
+        self.flush_every = flush_every
+        self.config_digest = hashlib.blake2b(repr(sorted(config.items())).encode(), digest_size=16).digest()
+        self.hits = 0
+        self.misses = 0
+        self._index = None
+        self._data = None
+        self._live_bytes = 0
+        self._unflushed = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_index'] = None
+        state['_data'] = None
+        return state
+
+    def open(self):
+        if self._index is not None:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        self._index = OrderedDict()
+        index_path = os.path.join(self.root, self.INDEX_FILE)
+        if os.path.exists(index_path):
+            for key, offset, rows, cols in np.fromfile(index_path, dtype=INDEX_DTYPE).tolist():
+                self._index[key] = (offset, rows, cols)
+        self._live_bytes = sum(rows * cols * 4 for _, rows, cols in self._index.values())
+        # appended arrays go at the end whatever the read position
+        self._data = open(os.path.join(self.root, self.DATA_FILE), 'a+b')
+
+    def image_key(self, img):
+        """Key of the image `img`(ndarray) with the settings of this cache"""
+        h = hashlib.blake2b(self.config_digest, digest_size=16)
+        h.update(str(img.shape).encode())
+        h.update(np.ascontiguousarray(img))
+        return h.digest()
+
+    def get(self, key):
+        """Cached detections(ndarray,(n,k)) of the image `key`, None if not cached"""
+        self.open()
+        entry = self._index.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._index.move_to_end(key)
+        offset, rows, cols = entry
+        self._data.seek(offset)
+        return np.frombuffer(self._data.read(rows * cols * 4), dtype=np.float32).reshape(rows, cols).copy()
+
+    def put(self, key, dets):
+        """Cache the detections(ndarray,(n,k)) of the image `key`"""
+        self.open()
+        dets = np.ascontiguousarray(dets, dtype=np.float32)
+        if dets.ndim != 2:
+            dets = dets.reshape(0, 0)
+        self._data.seek(0, os.SEEK_END)
+        offset = self._data.tell()
+        self._data.write(dets.tobytes())
+        if key in self._index:
+            _, rows, cols = self._index.pop(key)
+            self._live_bytes -= rows * cols * 4
+        self._index[key] = (offset, dets.shape[0], dets.shape[1])
+        self._live_bytes += dets.nbytes
+
+        if self._live_bytes > self.max_size:
+            # drop the least recently used entries, with some room left so that compaction is rare
+            while self._index and self._live_bytes > 0.9 * self.max_size:
+                _, (_, rows, cols) = self._index.popitem(last=False)
+                self._live_bytes -= rows * cols * 4
+            self.compact()
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every:
+            self.flush()
+
+    def compact(self):
+        """Rewrite the data file with the live entries only"""
+        data_path = os.path.join(self.root, self.DATA_FILE)
+        self._data.flush()
+        with open(data_path + '.tmp', 'wb') as f:
+            for key, (offset, rows, cols) in list(self._index.items()):
+                self._data.seek(offset)
+                self._index[key] = (f.tell(), rows, cols)
+                f.write(self._data.read(rows * cols * 4))
+        self._data.close()
+        os.replace(data_path + '.tmp', data_path)
+        self._data = open(data_path, 'a+b')
+        # the index must point to the new data file right away
+        self.flush()
+
+    def flush(self):
+        """Write the index back to disk"""
+        if self._index is None:
+            return
+        self._data.flush()
+        records = np.array([(key,) + entry for key, entry in self._index.items()], dtype=INDEX_DTYPE)
+        index_path = os.path.join(self.root, self.INDEX_FILE)
+        records.tofile(index_path + '.tmp')
+        os.replace(index_path + '.tmp', index_path)
+        self._unflushed = 0
+
+    def close(self):
+        if self._index is None:
+            return
+        data_size = self._data.seek(0, os.SEEK_END)
+        if data_size > 2 * self._live_bytes + (1 << 20):
+            # mostly entries that were replaced, or appended by a killed run
+            self.compact()
+        self.flush()
+        self._data.close()
+        self._index = None
+        self._data = None
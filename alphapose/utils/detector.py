@@ -1,47 +1,137 @@
-import os
 import sys
-from threading import Thread
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import count
+from threading import Event, Thread
 from queue import Queue
 
 import cv2
-import scipy.misc
 import numpy as np
 
 import torch
 import torch.multiprocessing as mp
 
+from alphapose.utils.bucket_batcher import BucketBatcher
+from alphapose.utils.det_cache import DetectionCache
+from alphapose.utils.frame_buffer import DEFAULT_SLOT_SIZE, SharedFrameBuffer
+from alphapose.utils.input_sources import build_input_source, decode_frame
 from alphapose.utils.presets import SimpleTransform
+from alphapose.utils.queue_monitor import QueueMonitor, frame_nbytes
+
+# detector shared by the decode workers, set once per worker by the pool initializer
+_decode_detector = None
+
+
+def _init_decode_worker(detector):
+    global _decode_detector
+    _decode_detector = detector
+
+
+def _decode_image(frame, inp_size=None, buckets=False):
+    """
+    Decode and letterbox one frame of an input source, run inside a decode worker.
+    With `buckets`, the frame is letterboxed to the detector input size fitting it.
+    """
+    frame = decode_frame(frame)
+    if buckets:
+        if isinstance(frame, str):
+            frame = cv2.imread(frame)
+        inp_size = _decode_detector.input_size(frame.shape[1], frame.shape[0])
+    # expected image shape like (1,3,h,w) or (3,h,w)
+    # the detector decodes image paths once and hands back the original (BGR) frame
+    kwargs = {} if inp_size is None else {'inp_size': inp_size}
+    img, orig_img = _decode_detector.image_preprocess(frame, return_orig=True, **kwargs)
+    if isinstance(img, np.ndarray):
+        img = torch.from_numpy(img)
+    # add one dimension at the front for batch if image shape (3,h,w)
+    if img.dim() == 3:
+        img = img.unsqueeze(0)
+    return img, orig_img
+
+
+def frame_thumbnail(img, size=64):
+    """Downsampled gray image used to measure how much a frame changed"""
+    h, w = img.shape[:2]
+    if img.strides[2] < 0:
+        # the channel order does not matter, undo the RGB view instead of copying the frame
+        img = img[:, :, ::-1]
+    thumb = cv2.resize(np.ascontiguousarray(img), (size, max(1, h * size // w)), interpolation=cv2.INTER_AREA)
+    return thumb.astype(np.float32).mean(axis=2)
 
 
 class DetectionLoader():
+    # det_queue and pose_queue hold this many times queueSize items
+    results_queue_scale = 10
+
     def __init__(self, input_source, detector, cfg, opt, mode='image', batchSize=1, queueSize=128):
         self.cfg = cfg
         self.opt = opt
         self.mode = mode
         self.device = opt.device
 
-        if mode == 'image':
-            self.img_dir = opt.inputpath
-            self.imglist = [os.path.join(self.img_dir, im_name.rstrip('\n').rstrip('\r')) for im_name in input_source]
-            self.datalen = len(input_source)
-        elif mode == 'video':
-            stream = cv2.VideoCapture(input_source)
-            assert stream.isOpened(), 'Cannot capture source'
-            self.path = input_source
-            self.datalen = int(stream.get(cv2.CAP_PROP_FRAME_COUNT))
-            self.fourcc = int(stream.get(cv2.CAP_PROP_FOURCC))
-            self.fps = stream.get(cv2.CAP_PROP_FPS)
-            self.frameSize = (int(stream.get(cv2.CAP_PROP_FRAME_WIDTH)), int(stream.get(cv2.CAP_PROP_FRAME_HEIGHT)))
-            self.videoinfo = {'fourcc': self.fourcc, 'fps': self.fps, 'frameSize': self.frameSize}
-            stream.release()
+        # frames are read from a registered `InputSource`, built for `mode` unless a source is given
+        self.input_source = build_input_source(input_source, opt, mode)
+        # the input may be streamed, e.g. by walking a directory, its length is then unknown
+        # and the end of the input is only marked by the `None` sentinel in the queues
+        self.datalen = self.input_source.length
+        self.videoinfo = self.input_source.videoinfo
+        # number of frames read ahead of the detector
+        self.decode_buffer = max(1, getattr(opt, 'decode_buffer', 16))
+        # decode seekable sources (videos) with several workers, each seeking to its own segments of frames
+        self.video_workers = 1
+        if self.input_source.seekable and self.datalen is not None:
+            self.video_workers = max(1, getattr(opt, 'video_workers', 1))
+        self.video_segment = max(1, getattr(opt, 'video_segment', 256))
+        # skip the detector on frames which barely differ from the last detected one
+        self.gate_thresh = getattr(opt, 'gate_thresh', 0)
+        self.gate_max_reuse = getattr(opt, 'gate_max_reuse', 10)
+        self._gate_ref = None
+        self._gate_dets = None
+        self._gate_reused = 0
 
         self.detector = detector
+        # high resolution images are detected on tiles of the original images as well
+        self.tiled = detector.tiled()
+        # detections of images seen by previous runs are read from an on-disk cache
+        self.det_cache = None
+        det_cache = getattr(opt, 'det_cache', '')
+        if det_cache:
+            cache_config = detector.cache_config()
+            if cache_config is None:
+                print('Detection cache disabled, the detections of {} cannot be cached'.format(type(detector).__name__))
+            else:
+                # rectangular inputs change the detections
+                cache_config = dict(cache_config, rect_inputs=getattr(opt, 'bucket_window', 0) > 0)
+                self.det_cache = DetectionCache(det_cache, cache_config,
+                                                max_size=int(getattr(opt, 'det_cache_size', 1024)) << 20)
+        # letterbox images to rectangular detector inputs fitting their aspect ratio instead of squares,
+        # images of the same input size are batched together within a window of `bucket_window` images
+        self.bucket_window = getattr(opt, 'bucket_window', 0)
+        self.inp_size = None
+        self.buckets = False
+        if self.bucket_window > 0:
+            if self.input_source.frame_size is not None:
+                # all the frames have the same size, e.g. a video, and one input size
+                self.inp_size = detector.input_size(*self.input_source.frame_size)
+            else:
+                # detectors without rectangular inputs have no input size,
+                # and the gate compares each frame with the previous one, which needs the input order
+                self.buckets = detector.input_size(1, 1) is not None and self.gate_thresh <= 0
 
         self.batchSize = batchSize
-        leftover = 0
-        if (self.datalen) % batchSize:
-            leftover = 1
-        self.num_batches = self.datalen // batchSize + leftover
+        # number of decode/letterbox workers, as threads or processes
+        self.decode_workers = max(1, getattr(opt, 'decode_workers', 1))
+        self.decode_backend = getattr(opt, 'decode_backend', 'thread')
+        if self.datalen is None:
+            self.num_batches = None
+        else:
+            leftover = 0
+            if (self.datalen) % batchSize:
+                leftover = 1
+            self.num_batches = self.datalen // batchSize + leftover
+        if self.video_workers > 1:
+            # whole batches per segment of the parallel video decoding, each worker may run one segment ahead
+            self.video_segment_batches = max(1, self.video_segment // batchSize)
 
         self._input_size = cfg.DATA_PRESET.IMAGE_SIZE
         self._output_size = cfg.DATA_PRESET.HEATMAP_SIZE
@@ -55,6 +145,13 @@ class DetectionLoader():
                 output_size=self._output_size,
                 rot=0, sigma=self._sigma,
                 train=False, add_dpg=False, gpu_device=self.device)
+        # crop the people by affine warps or by RoIAlign
+        self.crop_mode = getattr(opt, 'crop_mode', 'affine')
+        # leave the crops as uint8 pixels, normalized by the pose stage on its device
+        self.uint8_crops = getattr(opt, 'uint8_crops', False)
+        if self.uint8_crops and self.crop_mode != 'affine':
+            print('uint8 crops are only made by the affine crop mode, the crops are float')
+            self.uint8_crops = False
 
         # initialize the queue used to store data
         """
@@ -65,29 +162,54 @@ class DetectionLoader():
         if opt.sp:
             self._stopped = False
             self.image_queue = Queue(maxsize=queueSize)
-            self.det_queue = Queue(maxsize=10 * queueSize)
-            self.pose_queue = Queue(maxsize=10 * queueSize)
+            self.det_queue = Queue(maxsize=self.results_queue_scale * queueSize)
+            self.pose_queue = Queue(maxsize=self.results_queue_scale * queueSize)
         else:
             self._stopped = mp.Value('b', False)
             self.image_queue = mp.Queue(maxsize=queueSize)
-            self.det_queue = mp.Queue(maxsize=10 * queueSize)
-            self.pose_queue = mp.Queue(maxsize=10 * queueSize)
-
-    def start_worker(self, target):
+            self.det_queue = mp.Queue(maxsize=self.results_queue_scale * queueSize)
+            self.pose_queue = mp.Queue(maxsize=self.results_queue_scale * queueSize)
+
+        # frames the pre-processing workers may keep ahead, the shared memory buffer and the memory budget
+        # must hold them all, as well as the frames waiting for the earlier frames of their bucket window
+        self.min_frames = 2 * batchSize
+        if self.video_workers > 1:
+            self.min_frames += self.video_workers * self.video_segment_batches * batchSize
+        if self.buckets:
+            self.min_frames += self.bucket_window
+        # depth and wait-time counters of the queues, the frames in flight are kept under `memory_budget` MB
+        self.monitor = QueueMonitor(getattr(opt, 'memory_budget', 0), min_frames=self.min_frames)
+        self.monitor.register('image_queue', self.image_queue)
+        self.monitor.register('det_queue', self.det_queue)
+        self.monitor.register('pose_queue', self.pose_queue)
+
+        # in multi-process mode, original images can be stored in a shared memory ring buffer,
+        # so that only their handles are passed through the queues down to the DataWriter
+        self.frame_buffer = None
+        shm_frames = getattr(opt, 'shm_frames', 0)
+        if shm_frames > 0 and not opt.sp:
+            frame_size = self.input_source.frame_size
+            if frame_size is not None:
+                slot_size = frame_size[0] * frame_size[1] * 3
+            else:
+                slot_size = DEFAULT_SLOT_SIZE
+            self.frame_buffer = SharedFrameBuffer(max(shm_frames, self.min_frames), slot_size)
+
+    def start_worker(self, target, args=()):
         if self.opt.sp:
-            p = Thread(target=target, args=())
+            p = Thread(target=target, args=args)
         else:
-            p = mp.Process(target=target, args=())
+            p = mp.Process(target=target, args=args)
         # p.daemon = True
         p.start()
         return p
 
     def start(self):
         # start a thread to pre process images for object detection
-        if self.mode == 'image':
+        if self.video_workers > 1:
+            self.image_preprocess_worker = self.start_worker(self.frame_preprocess_parallel)
+        else:
             self.image_preprocess_worker = self.start_worker(self.image_preprocess)
-        elif self.mode == 'video':
-            self.image_preprocess_worker = self.start_worker(self.frame_preprocess)
         # start a thread to detect human in images
         self.image_detection_worker = self.start_worker(self.image_detection)
         # start a thread to post process cropped human image for pose estimation
@@ -119,138 +241,379 @@ class DetectionLoader():
             queue.get()
 
     def wait_and_put(self, queue, item):
-        queue.put(item)
+        if queue is self.image_queue and item[0] is not None:
+            # frames enter the pipeline, wait while it buffers more than the memory budget
+            imgs, orig_imgs = item[0], item[1]
+            self.monitor.acquire_frames([frame_nbytes(orig_imgs[k]) + imgs[k].nbytes for k in range(len(orig_imgs))])
+        self.monitor.put(queue, item)
 
     def wait_and_get(self, queue):
-        return queue.get()
+        return self.monitor.get(queue)
+
+    def queue_stats(self):
+        """Depth and wait-time counters of the pipeline queues, see `QueueMonitor.stats`"""
+        return self.monitor.stats()
+
+    def end_of_input(self, num_frames):
+        """Mark the end of the input in image_queue, unless the next stages expect exactly `num_frames` frames"""
+        if self.datalen is not None and num_frames >= self.datalen:
+            return
+        if self.datalen is not None:
+            # reached the end of the input earlier than expected
+            print('===========================> This input get ' + str(num_frames) + ' frames in total.')
+            sys.stdout.flush()
+        self.wait_and_put(self.image_queue, (None, None, None, None, None))
+
+    def frame_reader(self, frame_queue, done):
+        """Read the frames of the input source ahead of the batching loop into a bounded buffer"""
+        for im_name, frame in self.input_source.frames():
+            if self.stopped or done.is_set():
+                break
+            # encoded images are decoded here, image paths by the detector pre-processing,
+            # unless their size is needed to batch them by input size
+            frame = decode_frame(frame)
+            if self.buckets and isinstance(frame, str):
+                frame = cv2.imread(frame)
+            frame_queue.put((im_name, frame))
+        frame_queue.put((None, None))
+
+    def input_size(self, frame):
+        """Detector input size of a frame, None for the default size of the detector"""
+        if self.buckets:
+            return self.detector.input_size(frame.shape[1], frame.shape[0])
+        return self.inp_size
+
+    def batch_window(self):
+        """Number of images the batches may be reordered over, see `BucketBatcher`"""
+        return self.bucket_window if self.buckets else self.batchSize
 
     def image_preprocess(self):
-        for i in range(self.num_batches):
-            imgs = []
-            orig_imgs = []
-            im_names = []
-            im_dim_list = []
-            for k in range(i * self.batchSize, min((i + 1) * self.batchSize, self.datalen)):
+        if self.decode_workers > 1:
+            return self.image_preprocess_parallel()
+
+        # read frames in a separate thread, so that reading overlaps with detection and pose estimation
+        frame_queue = Queue(maxsize=self.decode_buffer)
+        done = Event()
+        reader = Thread(target=self.frame_reader, args=(frame_queue, done))
+        reader.start()
+
+        batcher = BucketBatcher(self.batchSize, self.batch_window())
+        num_frames = 0
+        try:
+            while True:
+                (im_name, frame) = frame_queue.get()
                 if self.stopped:
-                    self.wait_and_put(self.image_queue, (None, None, None, None))
+                    self.wait_and_put(self.image_queue, (None, None, None, None, None))
                     return
-                im_name_k = self.imglist[k]
-
-                # expected image shape like (1,3,h,w) or (3,h,w)
-                img_k = self.detector.image_preprocess(im_name_k)
-                if isinstance(img_k, np.ndarray):
-                    img_k = torch.from_numpy(img_k)
-                # add one dimension at the front for batch if image shape (3,h,w)
-                if img_k.dim() == 3:
-                    img_k = img_k.unsqueeze(0)
-                orig_img_k = scipy.misc.imread(im_name_k, mode='RGB')
-                im_dim_list_k = orig_img_k.shape[1], orig_img_k.shape[0]
-
-                imgs.append(img_k)
-                orig_imgs.append(orig_img_k)
-                im_names.append(im_name_k)
-                im_dim_list.append(im_dim_list_k)
-
-            with torch.no_grad():
-                # Human Detection
-                imgs = torch.cat(imgs)
-                im_dim_list = torch.FloatTensor(im_dim_list).repeat(1, 2)
-                # im_dim_list_ = im_dim_list
-
-            self.wait_and_put(self.image_queue, (imgs, orig_imgs, im_names, im_dim_list))
-
-    def frame_preprocess(self):
-        stream = cv2.VideoCapture(self.path)
-        assert stream.isOpened(), 'Cannot capture source'
-
-        for i in range(self.num_batches):
-            imgs = []
-            orig_imgs = []
+                if im_name is None:
+                    # the last batches may be partial
+                    batches = batcher.flush()
+                else:
+                    batches = batcher.add(self.input_size(frame), (im_name, frame))
+                for inp_size, positions, items in batches:
+                    im_names = [im_name_k for im_name_k, _ in items]
+                    # the detector letterboxes the whole batch at once and hands back the original (BGR) images
+                    imgs, orig_imgs = self.detector.images_preprocess([frame_k for _, frame_k in items], inp_size)
+                    self.wait_and_put(self.image_queue, self.batch_inputs(imgs, orig_imgs, im_names, positions))
+                    num_frames += len(items)
+                if im_name is None:
+                    break
+            self.end_of_input(num_frames)
+        finally:
+            done.set()
+            # unblock the reader if it waits for room in the buffer
+            while reader.is_alive():
+                self.clear(frame_queue)
+                reader.join(timeout=0.1)
+
+    def image_preprocess_parallel(self):
+        """
+        Decode and letterbox images with a pool of workers.
+        Workers finish images out of order, a bounded window of pending jobs is
+        consumed in submission order so that batches keep the input order.
+        """
+        if self.decode_backend == 'process':
+            executor_cls = ProcessPoolExecutor
+        else:
+            executor_cls = ThreadPoolExecutor
+        executor = executor_cls(max_workers=self.decode_workers,
+                                initializer=_init_decode_worker, initargs=(self.detector,))
+        # keep enough jobs in flight to fill two detection batches per worker
+        window = 2 * self.decode_workers * self.batchSize
+        pending = deque()
+        frames_iter = self.input_source.frames()
+        exhausted = False
+        # the decoded images are batched by input size
+        batcher = BucketBatcher(self.batchSize, self.batch_window())
+        num_frames = 0
+
+        try:
+            while True:
+                if self.stopped:
+                    self.wait_and_put(self.image_queue, (None, None, None, None, None))
+                    return
+                while not exhausted and len(pending) < window:
+                    item = next(frames_iter, None)
+                    if item is None:
+                        exhausted = True
+                        break
+                    im_name, frame = item
+                    pending.append((im_name, executor.submit(_decode_image, frame, self.inp_size, self.buckets)))
+                end = len(pending) == 0
+                if end:
+                    # the last batches may be partial
+                    batches = batcher.flush()
+                else:
+                    im_name, future = pending.popleft()
+                    img_k, orig_img_k = future.result()
+                    batches = batcher.add(tuple(img_k.shape[2:]), (im_name, img_k, orig_img_k))
+
+                for _, positions, items in batches:
+                    imgs = torch.cat([img_k for _, img_k, _ in items])
+                    orig_imgs = [orig_img_k for _, _, orig_img_k in items]
+                    im_names = [im_name_k for im_name_k, _, _ in items]
+                    self.wait_and_put(self.image_queue, self.batch_inputs(imgs, orig_imgs, im_names, positions))
+                    num_frames += len(items)
+                if end:
+                    break
+            self.end_of_input(num_frames)
+        finally:
+            for _, future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def frame_segment_worker(self, worker_id, segment_queue, done):
+        """
+        Decode and pre-process the segments `worker_id`, `worker_id + n`, ... of the input source.
+        Each segment starts by seeking the source, then its batches are put to `segment_queue`.
+        """
+        segment_len = self.video_segment_batches * self.batchSize
+        num_segments = (self.datalen + segment_len - 1) // segment_len
+        for seg in range(worker_id, num_segments, self.video_workers):
+            begin, end = seg * segment_len, min((seg + 1) * segment_len, self.datalen)
+            frames = []
             im_names = []
-            im_dim_list = []
-            for k in range(i * self.batchSize, min((i + 1) * self.batchSize, self.datalen)):
-                (grabbed, frame) = stream.read()
-                # if the `grabbed` boolean is `False`, then we have
-                # reached the end of the video file
-                if not grabbed or self.stopped:
-                    # put the rest pre-processed data to the queue
-                    if len(imgs) > 0:
-                        with torch.no_grad():
-                            # Record original image resolution
-                            imgs = torch.cat(imgs)
-                            im_dim_list = torch.FloatTensor(im_dim_list).repeat(1, 2)
-                        self.wait_and_put(self.image_queue, (imgs, orig_imgs, im_names, im_dim_list))
-                    self.wait_and_put(self.image_queue, (None, None, None, None))
-                    print('===========================> This video get ' + str(k) + ' frames in total.')
-                    sys.stdout.flush()
-                    stream.release()
+            num_frames = 0
+            for im_name, frame in self.input_source.frames(begin, end):
+                if self.stopped or done.is_set():
                     return
+                frames.append(frame)
+                im_names.append(im_name)
+                if len(frames) == self.batchSize:
+                    imgs, orig_imgs = self.detector.images_preprocess(frames, self.inp_size)
+                    positions = list(range(begin + num_frames, begin + num_frames + len(frames)))
+                    segment_queue.put(self.batch_inputs(imgs, orig_imgs, im_names, positions))
+                    num_frames += len(frames)
+                    frames = []
+                    im_names = []
+            if len(frames) > 0:
+                imgs, orig_imgs = self.detector.images_preprocess(frames, self.inp_size)
+                positions = list(range(begin + num_frames, begin + num_frames + len(frames)))
+                segment_queue.put(self.batch_inputs(imgs, orig_imgs, im_names, positions))
+                num_frames += len(frames)
+            if num_frames < end - begin:
+                # reached the end of the video file earlier than expected
+                segment_queue.put((None, None, None, None, None))
+                return
 
-                # expected frame shape like (1,3,h,w) or (3,h,w)
-                img_k = self.detector.image_preprocess(frame)
-
-                if isinstance(img_k, np.ndarray):
-                    img_k = torch.from_numpy(img_k)
-                # add one dimension at the front for batch if image shape (3,h,w)
-                if img_k.dim() == 3:
-                    img_k = img_k.unsqueeze(0)
-
-                im_dim_list_k = frame.shape[1], frame.shape[0]
-
-                imgs.append(img_k)
-                orig_imgs.append(frame[:, :, ::-1])
-                im_names.append(str(k) + '.jpg')
-                im_dim_list.append(im_dim_list_k)
-
-            with torch.no_grad():
-                # Record original image resolution
-                imgs = torch.cat(imgs)
-                im_dim_list = torch.FloatTensor(im_dim_list).repeat(1, 2)
-                # im_dim_list_ = im_dim_list
-
-            self.wait_and_put(self.image_queue, (imgs, orig_imgs, im_names, im_dim_list))
-        stream.release()
+    def frame_preprocess_parallel(self):
+        """
+        Decode a seekable source, e.g. a video, with `video_workers` workers in parallel.
+        The sampled timeline is split into segments of `video_segment` frames which are dealt
+        round-robin to the workers. Each worker seeks to the start of its segments, so the
+        workers decode consecutive segments at the same time, and reading their batches
+        round-robin gives back one ordered stream.
+        """
+        if self.opt.sp:
+            done = Event()
+            segment_queues = [Queue(maxsize=self.video_segment_batches) for _ in range(self.video_workers)]
+        else:
+            done = mp.Event()
+            segment_queues = [mp.Queue(maxsize=self.video_segment_batches) for _ in range(self.video_workers)]
+        workers = [self.start_worker(self.frame_segment_worker, args=(i, segment_queues[i], done))
+                   for i in range(self.video_workers)]
+
+        try:
+            for i in range(self.num_batches):
+                segment_queue = segment_queues[(i // self.video_segment_batches) % self.video_workers]
+                batch = segment_queue.get()
+                if batch[0] is None or self.stopped:
+                    self.wait_and_put(self.image_queue, (None, None, None, None, None))
+                    print('===========================> This input get ' + str(i * self.batchSize) + ' frames in total.')
+                    sys.stdout.flush()
+                    return
+                self.wait_and_put(self.image_queue, batch)
+                if len(batch[0]) < self.batchSize and i < self.num_batches - 1:
+                    # a worker reached the end of the video file earlier than expected
+                    self.wait_and_put(self.image_queue, (None, None, None, None, None))
+                    return
+        finally:
+            done.set()
+            # unblock the workers waiting for room in their queues
+            for worker, segment_queue in zip(workers, segment_queues):
+                while worker.is_alive():
+                    self.clear(segment_queue)
+                    worker.join(timeout=0.1)
+
+    def batch_inputs(self, imgs, orig_imgs, im_names, positions):
+        """Pack a pre-processed mini-batch, and the positions of its images in the input, as an item of image_queue"""
+        # image channel BGR->RGB
+        orig_imgs = [orig_img[:, :, ::-1] for orig_img in orig_imgs]
+        with torch.no_grad():
+            # Record original image resolution
+            im_dim_list = [(orig_img.shape[1], orig_img.shape[0]) for orig_img in orig_imgs]
+            im_dim_list = torch.FloatTensor(im_dim_list).repeat(1, 2)
+        if self.frame_buffer is not None:
+            orig_imgs = [self.frame_buffer.put(orig_img) for orig_img in orig_imgs]
+        return (imgs, orig_imgs, im_names, im_dim_list, positions)
 
     def image_detection(self):
-        for i in range(self.num_batches):
-            imgs, orig_imgs, im_names, im_dim_list = self.wait_and_get(self.image_queue)
-            if imgs is None or self.stopped:
-                self.wait_and_put(self.det_queue, (None, None, None, None, None, None, None))
-                return
-
-            with torch.no_grad():
-                # pad useless images to fill a batch, else there will be a bug
-                for pad_i in range(self.batchSize - len(imgs)):
-                    imgs = torch.cat((imgs, torch.unsqueeze(imgs[0], dim=0)), 0)
-                    im_dim_list = torch.cat((im_dim_list, torch.unsqueeze(im_dim_list[0], dim=0)), 0)
+        # batches may come out of input order when they are grouped by input size,
+        # the detections of each frame wait here until all the frames before it are done
+        ready = {}
+        next_pos = 0
+        try:
+            # loop until the end of input sentinel if the number of frames is unknown
+            while self.datalen is None or next_pos < self.datalen:
+                imgs, orig_imgs, im_names, im_dim_list, positions = self.wait_and_get(self.image_queue)
+                if imgs is None or self.stopped:
+                    self.wait_and_put(self.det_queue, (None, None, None, None, None, None, None))
+                    return
 
-                dets = self.detector.images_detection(imgs, im_dim_list)
+                with torch.no_grad():
+                    if self.gate_thresh > 0:
+                        dets = self.gated_detection(imgs, orig_imgs, im_dim_list)
+                    else:
+                        dets = self.batch_detection(imgs, im_dim_list, orig_imgs)
                 if isinstance(dets, int) or dets.shape[0] == 0:
                     for k in range(len(orig_imgs)):
-                        self.wait_and_put(self.det_queue, (orig_imgs[k], im_names[k], None, None, None, None, None))
-                    continue
-                if isinstance(dets, np.ndarray):
-                    dets = torch.from_numpy(dets)
-                dets = dets.cpu()
-                boxes = dets[:, 1:5]
-                scores = dets[:, 5:6]
-                if self.opt.tracking:
-                    ids = dets[:, 6:7]
+                        ready[positions[k]] = (orig_imgs[k], im_names[k], None, None, None, None, None)
                 else:
-                    ids = torch.zeros(scores.shape)
+                    boxes = dets[:, 1:5]
+                    scores = dets[:, 5:6]
+                    if self.opt.tracking:
+                        ids = dets[:, 6:7]
+                    else:
+                        ids = torch.zeros(scores.shape)
 
-            for k in range(len(orig_imgs)):
-                boxes_k = boxes[dets[:, 0] == k]
-                if isinstance(boxes_k, int) or boxes_k.shape[0] == 0:
-                    self.wait_and_put(self.det_queue, (orig_imgs[k], im_names[k], None, None, None, None, None))
-                    continue
-                inps = torch.zeros(boxes_k.size(0), 3, *self._input_size)
-                cropped_boxes = torch.zeros(boxes_k.size(0), 4)
+                    for k in range(len(orig_imgs)):
+                        boxes_k = boxes[dets[:, 0] == k]
+                        if isinstance(boxes_k, int) or boxes_k.shape[0] == 0:
+                            ready[positions[k]] = (orig_imgs[k], im_names[k], None, None, None, None, None)
+                            continue
+                        # the crops are made by image_postprocess, in one batch per frame
+                        ready[positions[k]] = (orig_imgs[k], im_names[k], boxes_k, scores[dets[:, 0] == k], ids[dets[:, 0] == k], None, None)
+
+                while next_pos in ready:
+                    self.wait_and_put(self.det_queue, ready.pop(next_pos))
+                    next_pos += 1
+        finally:
+            if self.det_cache is not None:
+                print('Detection cache: {} hits, {} misses'.format(self.det_cache.hits, self.det_cache.misses))
+                self.det_cache.close()
+
+    def batch_detection(self, imgs, im_dim_list, orig_imgs=None):
+        """
+        Run the detector on a mini-batch, return the detections(torch.FloatTensor on cpu) or 0 if none.
+        With a detection cache, only the images of `orig_imgs` which are not cached are detected.
+        """
+        if orig_imgs is not None and self.frame_buffer is not None and (self.det_cache is not None or self.tiled):
+            orig_imgs = [self.frame_buffer.get(orig_img) for orig_img in orig_imgs]
+        if self.det_cache is not None and orig_imgs is not None:
+            return self.cached_detection(imgs, im_dim_list, orig_imgs)
+        return self.detect(imgs, im_dim_list, orig_imgs)
 
-                self.wait_and_put(self.det_queue, (orig_imgs[k], im_names[k], boxes_k, scores[dets[:, 0] == k], ids[dets[:, 0] == k], inps, cropped_boxes))
+    def detect(self, imgs, im_dim_list, orig_imgs=None):
+        """
+        Run the detector, on tiles of the original images(ndarray,channel RGB) if it is tiled,
+        the tiles are pre-processed like the input images, from BGR
+        """
+        # partial batches are detected as they are, the detectors handle any batch size
+        if self.tiled and orig_imgs is not None:
+            # image channel RGB->BGR, a view, only the tiles are copied
+            orig_imgs = [orig_img[:, :, ::-1] for orig_img in orig_imgs]
+            # the tiles of the whole mini-batch share network batches of the same size
+            dets = self.detector.tiles_detection(imgs, orig_imgs, im_dim_list, self.batchSize)
+        else:
+            dets = self.detector.images_detection(imgs, im_dim_list)
+        if isinstance(dets, int) or dets.shape[0] == 0:
+            return 0
+        if isinstance(dets, np.ndarray):
+            dets = torch.from_numpy(dets)
+        return dets.cpu()
+
+    def cached_detection(self, imgs, im_dim_list, orig_imgs):
+        """Read the detections of the cached images from the detection cache, detect and cache the others"""
+        keys = [self.det_cache.image_key(orig_img) for orig_img in orig_imgs]
+        cached = [self.det_cache.get(key) for key in keys]
+        misses = [k for k, dets_k in enumerate(cached) if dets_k is None]
+        if len(misses) > 0:
+            dets = self.detect(imgs[misses], im_dim_list[misses], [orig_imgs[k] for k in misses])
+            for j, k in enumerate(misses):
+                if isinstance(dets, int):
+                    cached[k] = np.zeros((0, 0), dtype=np.float32)
+                else:
+                    cached[k] = dets[dets[:, 0] == j, 1:].numpy()
+                self.det_cache.put(keys[k], cached[k])
+
+        outputs = [torch.cat((torch.full((len(dets_k), 1), float(k)), torch.from_numpy(dets_k)), 1)
+                   for k, dets_k in enumerate(cached) if len(dets_k) > 0]
+        if len(outputs) == 0:
+            return 0
+        return torch.cat(outputs)
+
+    def gate_frames(self, orig_imgs):
+        """
+        Decide for each frame whether the detector runs on it. A frame is skipped when its
+        downsampled difference with the last detected frame is under `gate_thresh`, unless
+        `gate_max_reuse` frames in a row were already skipped.
+        """
+        keyframes = []
+        for orig_img in orig_imgs:
+            if self.frame_buffer is not None:
+                orig_img = self.frame_buffer.get(orig_img)
+            thumb = frame_thumbnail(orig_img)
+            static = (self._gate_ref is not None and thumb.shape == self._gate_ref.shape
+                      and self._gate_reused < self.gate_max_reuse
+                      and np.abs(thumb - self._gate_ref).mean() < self.gate_thresh)
+            if static:
+                self._gate_reused += 1
+            else:
+                # compare the next frames to this one, so that slow changes add up
+                self._gate_ref = thumb
+                self._gate_reused = 0
+            keyframes.append(not static)
+        return keyframes
+
+    def gated_detection(self, imgs, orig_imgs, im_dim_list):
+        """
+        Run the detector only on the frames that changed, the detections of static frames are
+        propagated from the last detected frame by the detector, e.g. reused or tracked.
+        Consecutive frames of the same kind are processed together, in order.
+        """
+        keyframes = self.gate_frames(orig_imgs)
+        outputs = []
+        start = 0
+        for end in range(1, len(keyframes) + 1):
+            if end < len(keyframes) and keyframes[end] == keyframes[start]:
+                continue
+            if keyframes[start]:
+                dets = self.batch_detection(imgs[start:end], im_dim_list[start:end], orig_imgs[start:end])
+                # keep the detections of the last frame for the next static frames
+                self._gate_dets = None if isinstance(dets, int) else dets[dets[:, 0] == end - start - 1]
+            else:
+                dets = self.detector.images_propagation(self._gate_dets, im_dim_list[start:end])
+            if not isinstance(dets, int) and dets.shape[0] > 0:
+                dets = dets.clone()
+                dets[:, 0] += start
+                outputs.append(dets)
+            start = end
+        if len(outputs) == 0:
+            return 0
+        return torch.cat(outputs)
 
     def image_postprocess(self):
-        for i in range(self.datalen):
+        for i in (range(self.datalen) if self.datalen is not None else count()):
             with torch.no_grad():
                 (orig_img, im_name, boxes, scores, ids, inps, cropped_boxes) = self.wait_and_get(self.det_queue)
                 if orig_img is None or self.stopped:
@@ -261,16 +624,36 @@ class DetectionLoader():
                     continue
                 # imght = orig_img.shape[0]
                 # imgwidth = orig_img.shape[1]
-                for i, box in enumerate(boxes):
-                    inps[i], cropped_box = self.transformation.test_transform(orig_img, box)
-                    cropped_boxes[i] = torch.FloatTensor(cropped_box)
-
-                # inps, cropped_boxes = self.transformation.align_transform(orig_img, boxes)
+                img = orig_img
+                if self.frame_buffer is not None:
+                    img = self.frame_buffer.get(orig_img)
+                # all the people of the frame are cropped at once
+                if self.crop_mode == 'roi_align':
+                    inps, cropped_boxes = self.transformation.align_transform(img, boxes)
+                else:
+                    inps, cropped_boxes = self.transformation.test_transform_batch(img, boxes, uint8=self.uint8_crops)
 
                 self.wait_and_put(self.pose_queue, (inps, orig_img, im_name, boxes, scores, ids, cropped_boxes))
 
-    def read(self):
-        return self.wait_and_get(self.pose_queue)
+    def read(self, timeout=None):
+        """Next frame of pose_queue, raises queue.Empty if none came within `timeout` seconds"""
+        return self.monitor.get(self.pose_queue, timeout=timeout)
+
+    def max_held_frames(self):
+        """
+        Number of frames read from the pipeline that may be kept before they are saved, e.g. to batch
+        the pose model over several frames, without holding the shared memory slots or the memory budget
+        the pre-processing needs to bring in the next frame. None if unlimited.
+        """
+        limits = []
+        if self.frame_buffer is not None:
+            limits.append(self.frame_buffer.num_slots - self.min_frames)
+        capacity = self.monitor.frame_capacity()
+        if capacity is not None:
+            limits.append(capacity - self.min_frames)
+        if len(limits) == 0:
+            return None
+        return max(0, min(limits))
 
     @property
     def stopped(self):
@@ -281,6 +664,7 @@ class DetectionLoader():
 
     @property
     def length(self):
+        # None if the input is streamed and its length is unknown
         return self.datalen
 
     @property
@@ -0,0 +1,65 @@
+import fnmatch
+import os
+
+
+class DirectoryWalker(object):
+    """Lazily walk a directory and all its sub-directories for input images.
+
+    Paths relative to `root` are yielded one directory at a time, in sorted
+    order, so that the input can be streamed without listing the whole tree
+    first. The walker is picklable and can be iterated several times.
+
+    Parameters
+    ----------
+    root: str
+        Directory to walk.
+    include: list of str
+        Glob patterns matched against the relative path, a file is kept if it
+        matches any of them. All files are kept if empty.
+    exclude: list of str
+        Glob patterns matched against the relative path, a file is dropped if
+        it matches any of them.
+    """
+
+    def __init__(self, root, include=(), exclude=()):
+        self.root = root
+        self.include = list(include)
+        self.exclude = list(exclude)
+
+    def match(self, path):
+        return match_patterns(path, self.include, self.exclude)
+
+    def __iter__(self):
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            # walk sub-directories in a deterministic order
+            dirnames.sort()
+            for filename in sorted(filenames):
+                path = os.path.relpath(os.path.join(dirpath, filename), self.root)
+                if self.match(path):
+                    yield path
+
+
+class ListFile(object):
+    """Lazily read input image names from a text file, one per line."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __iter__(self):
+        with open(self.path, 'r') as f:
+            for line in f:
+                line = line.rstrip('\n').rstrip('\r')
+                if line:
+                    yield line
+
+
+def match_patterns(path, include=(), exclude=()):
+    """Whether `path` matches any of the `include` glob patterns (all paths if empty) and none of `exclude`"""
+    if include and not any(fnmatch.fnmatch(path, pattern) for pattern in include):
+        return False
+    return not any(fnmatch.fnmatch(path, pattern) for pattern in exclude)
+
+
+def split_patterns(patterns):
+    """Split comma separated glob patterns of a command line option"""
+    return [p.strip() for p in patterns.split(',') if p.strip()]
@@ -0,0 +1,78 @@
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+
+# slot size used when the frame size is not known in advance, fits a 4K RGB frame
+DEFAULT_SLOT_SIZE = 3840 * 2160 * 3
+
+
+class FrameHandle(object):
+    """Reference to a frame stored in one slot of a `SharedFrameBuffer`."""
+    __slots__ = ('slot', 'shape')
+
+    def __init__(self, slot, shape):
+        self.slot = slot
+        self.shape = shape
+
+    def __getstate__(self):
+        return self.slot, self.shape
+
+    def __setstate__(self, state):
+        self.slot, self.shape = state
+
+
+class SharedFrameBuffer(object):
+    """Ring buffer of uint8 frame slots in shared memory.
+
+    Frames are copied once into a free slot and only a small `FrameHandle`
+    is sent through the multiprocessing queues, instead of pickling the whole
+    frame at every stage. The slot is given back with `release` or `take`
+    once the last stage is done with the frame. When all slots are in use,
+    `put` blocks, which bounds the number of frames in flight.
+
+    Parameters
+    ----------
+    num_slots: int
+        Number of frames that can be stored at the same time.
+    slot_size: int
+        Size of one slot in bytes. Larger frames are passed as they are.
+    """
+
+    def __init__(self, num_slots, slot_size=DEFAULT_SLOT_SIZE):
+        self.num_slots = num_slots
+        self.slot_size = slot_size
+        self.storage = torch.empty((num_slots, slot_size), dtype=torch.uint8).share_memory_()
+        self.free_slots = mp.Queue(maxsize=num_slots)
+        for slot in range(num_slots):
+            self.free_slots.put(slot)
+
+    def _view(self, handle):
+        nbytes = int(np.prod(handle.shape))
+        return self.storage[handle.slot, :nbytes].numpy().reshape(handle.shape)
+
+    def put(self, img):
+        """Copy `img`(ndarray) into a free slot and return its handle."""
+        if img.dtype != np.uint8 or img.nbytes > self.slot_size:
+            return img
+        handle = FrameHandle(self.free_slots.get(), img.shape)
+        np.copyto(self._view(handle), img)
+        return handle
+
+    def get(self, frame):
+        """Return the frame of a handle as ndarray, without copy. Other frames are returned as they are."""
+        if isinstance(frame, FrameHandle):
+            return self._view(frame)
+        return frame
+
+    def release(self, frame):
+        """Give the slot of a handle back to the buffer."""
+        if isinstance(frame, FrameHandle):
+            self.free_slots.put(frame.slot)
+
+    def take(self, frame):
+        """Copy the frame of a handle out of the buffer and release its slot."""
+        if not isinstance(frame, FrameHandle):
+            return frame
+        img = self._view(frame).copy()
+        self.release(frame)
+        return img
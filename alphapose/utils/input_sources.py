@@ -0,0 +1,269 @@
+import glob
+import math
+import os
+import tarfile
+import zipfile
+from abc import ABC, abstractmethod
+
+import cv2
+import numpy as np
+
+from alphapose.utils.file_walker import match_patterns, split_patterns
+from alphapose.utils.registry import Registry, build_from_cfg
+
+INPUT_SOURCE = Registry('input_source')
+
+# members of archives read by default, shards often hold sidecar files, e.g. .json labels
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff', '.webp')
+
+# input source used for each mode of `DetectionLoader`
+MODE_SOURCES = {
+    'image': 'ImageSource',
+    'video': 'VideoSource',
+    'webcam': 'WebcamSource',
+    'archive': 'ArchiveSource'
+}
+
+
+class InputSource(ABC):
+    """Base class of the inputs of `DetectionLoader`.
+
+    A source yields `(im_name, frame)` pairs from `frames`, where the frame is
+    an image path, a BGR image (ndarray) or an encoded image (bytes). Sources
+    are pickled to the loader workers in multi-process mode, so files should
+    only be opened inside `frames`.
+
+    Parameters
+    ----------
+    source: object
+        What to read, e.g. a list of image names or a video path.
+    opt: argparse.Namespace
+        Options of the demo.
+    """
+    # whether `frames` can start at any frame, which allows parallel decoding of segments
+    seekable = False
+
+    def __init__(self, source, opt):
+        self.source = source
+
+    @property
+    def length(self):
+        """Number of frames, None if unknown."""
+        return None
+
+    @property
+    def videoinfo(self):
+        """fourcc, fps and frameSize of a video output, None if the frames are not a video."""
+        return None
+
+    @property
+    def frame_size(self):
+        """(width, height) of all the frames, None if it varies."""
+        return None
+
+    @abstractmethod
+    def frames(self, begin=0, end=None):
+        """Iterate over the frames, from `begin` to `end` if the source is seekable."""
+        pass
+
+
+@INPUT_SOURCE.register_module
+class ImageSource(InputSource):
+    """Image files, given by a list (or a lazy iterable) of names in `opt.inputpath`."""
+
+    def __init__(self, source, opt):
+        super(ImageSource, self).__init__(source, opt)
+        self.img_dir = getattr(opt, 'inputpath', '')
+
+    @property
+    def length(self):
+        # the names may be streamed, e.g. by walking a directory
+        return len(self.source) if hasattr(self.source, '__len__') else None
+
+    def frames(self, begin=0, end=None):
+        for im_name in self.source:
+            im_name = os.path.join(self.img_dir, im_name.rstrip('\n').rstrip('\r'))
+            # the image is decoded by the detector pre-processing
+            yield im_name, im_name
+
+
+@INPUT_SOURCE.register_module
+class VideoSource(InputSource):
+    """Frames of a video file, sampled every `opt.frame_stride` frames or at `opt.sample_fps`."""
+    seekable = True
+
+    def __init__(self, source, opt):
+        super(VideoSource, self).__init__(source, opt)
+        stream = cv2.VideoCapture(source)
+        assert stream.isOpened(), 'Cannot capture source'
+        self.path = source
+        self.num_frames = int(stream.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.fourcc = int(stream.get(cv2.CAP_PROP_FOURCC))
+        self.fps = stream.get(cv2.CAP_PROP_FPS)
+        self.frameSize = (int(stream.get(cv2.CAP_PROP_FRAME_WIDTH)), int(stream.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        stream.release()
+
+        # only keep every `frame_stride`-th frame, or frames sampled at `sample_fps` on the video timeline
+        self.frame_stride = max(1, getattr(opt, 'frame_stride', 1))
+        self.sample_rate = 1.0
+        sample_fps = getattr(opt, 'sample_fps', 0)
+        if sample_fps > 0 and self.fps > 0:
+            self.frame_stride = 1
+            self.sample_rate = min(1.0, sample_fps / self.fps)
+
+    @property
+    def length(self):
+        if self.num_frames > 0:
+            return int((self.num_frames - 1) * self.sample_rate) // self.frame_stride + 1
+        return 0
+
+    @property
+    def videoinfo(self):
+        # frames of the output video are the sampled ones
+        return {'fourcc': self.fourcc, 'fps': self.fps * self.sample_rate / self.frame_stride,
+                'frameSize': self.frameSize}
+
+    @property
+    def frame_size(self):
+        return self.frameSize
+
+    def is_sampled(self, k):
+        """Whether the k-th frame of the video is kept on the sampled timeline"""
+        if self.sample_rate < 1.0:
+            return k == 0 or int(k * self.sample_rate) > int((k - 1) * self.sample_rate)
+        return k % self.frame_stride == 0
+
+    def sampled_frame_id(self, s):
+        """Index in the original video of the s-th frame on the sampled timeline"""
+        if self.sample_rate < 1.0:
+            k = int(math.ceil(s / self.sample_rate))
+            # guard against float rounding, keep consistent with is_sampled
+            while int(k * self.sample_rate) < s:
+                k += 1
+            while k > 0 and int((k - 1) * self.sample_rate) >= s:
+                k -= 1
+            return k
+        return s * self.frame_stride
+
+    def frames(self, begin=0, end=None):
+        """Iterate over the sampled frames `begin` to `end`, seeking the video to the first one"""
+        end = self.length if end is None else min(end, self.length)
+        stream = cv2.VideoCapture(self.path)
+        assert stream.isOpened(), 'Cannot capture source'
+        k = self.sampled_frame_id(begin)
+        if k > 0:
+            stream.set(cv2.CAP_PROP_POS_FRAMES, k)
+        s = begin
+        try:
+            while s < end and k < self.num_frames:
+                if not self.is_sampled(k):
+                    # skip the frame without decoding it
+                    if not stream.grab():
+                        break
+                else:
+                    (grabbed, frame) = stream.read()
+                    if not grabbed:
+                        break
+                    # name the frame by its index in the original video
+                    yield str(k) + '.jpg', frame
+                    s += 1
+                k += 1
+        finally:
+            stream.release()
+
+
+@INPUT_SOURCE.register_module
+class WebcamSource(InputSource):
+    """Frames of a webcam, given by its index, until the capture fails."""
+
+    def __init__(self, source, opt):
+        super(WebcamSource, self).__init__(int(source), opt)
+        stream = cv2.VideoCapture(self.source)
+        assert stream.isOpened(), 'Cannot capture source'
+        self.fourcc = int(stream.get(cv2.CAP_PROP_FOURCC))
+        self.fps = stream.get(cv2.CAP_PROP_FPS)
+        self.frameSize = (int(stream.get(cv2.CAP_PROP_FRAME_WIDTH)), int(stream.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        stream.release()
+
+    @property
+    def videoinfo(self):
+        return {'fourcc': self.fourcc, 'fps': self.fps, 'frameSize': self.frameSize}
+
+    @property
+    def frame_size(self):
+        return self.frameSize
+
+    def frames(self, begin=0, end=None):
+        stream = cv2.VideoCapture(self.source)
+        assert stream.isOpened(), 'Cannot capture source'
+        i = 0
+        try:
+            while True:
+                (grabbed, frame) = stream.read()
+                if not grabbed:
+                    return
+                yield str(i) + '.jpg', frame
+                i += 1
+        finally:
+            stream.release()
+
+
+@INPUT_SOURCE.register_module
+class ArchiveSource(InputSource):
+    """Images packed in tar or zip archive shards, read sequentially.
+
+    Reading the members in archive order avoids opening every image as a
+    small file, which is slow on network filesystems. Tar shards are read as
+    a stream and may be compressed. Members are filtered by the glob patterns
+    of `opt.include` and `opt.exclude`, without `opt.include` only the members
+    with an image extension of `IMAGE_EXTENSIONS` are read.
+
+    `source` is a list of archive paths, or a string of comma separated paths
+    and glob patterns.
+    """
+
+    def __init__(self, source, opt):
+        if isinstance(source, str):
+            paths = []
+            for pattern in split_patterns(source):
+                paths.extend(sorted(glob.glob(pattern)) or [pattern])
+            source = paths
+        super(ArchiveSource, self).__init__(source, opt)
+        self.include = split_patterns(getattr(opt, 'include', ''))
+        self.exclude = split_patterns(getattr(opt, 'exclude', ''))
+
+    def is_selected(self, name):
+        """Whether the archive member `name` is read"""
+        if not self.include and os.path.splitext(name)[1].lower() not in IMAGE_EXTENSIONS:
+            return False
+        return match_patterns(name, self.include, self.exclude)
+
+    def frames(self, begin=0, end=None):
+        for path in self.source:
+            if zipfile.is_zipfile(path):
+                with zipfile.ZipFile(path) as archive:
+                    for info in archive.infolist():
+                        if info.is_dir() or not self.is_selected(info.filename):
+                            continue
+                        yield info.filename, archive.read(info)
+            else:
+                with tarfile.open(path, 'r|*') as archive:
+                    for member in archive:
+                        if not member.isfile() or not self.is_selected(member.name):
+                            continue
+                        yield member.name, archive.extractfile(member).read()
+
+
+def decode_frame(frame):
+    """Decode a frame given as encoded image (bytes), other frames are returned as they are."""
+    if isinstance(frame, bytes):
+        frame = cv2.imdecode(np.frombuffer(frame, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return frame
+
+
+def build_input_source(source, opt, mode='image'):
+    """Build the input source of `mode`, which is a key of `MODE_SOURCES` or a registered source name."""
+    if isinstance(source, InputSource):
+        return source
+    cfg = {'TYPE': MODE_SOURCES.get(mode, mode), 'source': source, 'opt': opt}
+    return build_from_cfg(cfg, INPUT_SOURCE)
@@ -300,7 +300,8 @@ def write_json(all_results, outputpath, form=None, for_eval=False):
             if for_eval:
                 result['image_id'] = int(os.path.basename(im_name).split('.')[0].split('_')[-1])
             else:
-                result['image_id'] = os.path.basename(im_name)
+                # names of images in sub-directories keep their relative path, to be unique
+                result['image_id'] = im_name.replace(os.sep, '/')
             result['category_id'] = 1
 
             kp_preds = human['keypoints']
@@ -355,7 +356,10 @@ def write_json(all_results, outputpath, form=None, for_eval=False):
             if not os.path.exists(os.path.join(outputpath,'sep-json')):
                 os.mkdir(os.path.join(outputpath,'sep-json'))
             for name in json_results_cmu.keys():
-                with open(os.path.join(outputpath,'sep-json',name.split('.')[0]+'.json'),'w') as json_file:
+                path = os.path.join(outputpath,'sep-json',os.path.splitext(name)[0]+'.json')
+                if not os.path.exists(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path,'w') as json_file:
                     json_file.write(json.dumps(json_results_cmu[name]))
     elif form == 'open': # the form of OpenPose
         with open(os.path.join(outputpath,'alphapose-results.json'), 'w') as json_file:
@@ -363,7 +367,10 @@ def write_json(all_results, outputpath, form=None, for_eval=False):
             if not os.path.exists(os.path.join(outputpath,'sep-json')):
                 os.mkdir(os.path.join(outputpath,'sep-json'))
             for name in json_results_cmu.keys():
-                with open(os.path.join(outputpath,'sep-json',name.split('.')[0]+'.json'),'w') as json_file:
+                path = os.path.join(outputpath,'sep-json',os.path.splitext(name)[0]+'.json')
+                if not os.path.exists(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path,'w') as json_file:
                     json_file.write(json.dumps(json_results_cmu[name]))
     else:
         with open(os.path.join(outputpath), 'w') as json_file:
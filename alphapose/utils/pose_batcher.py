@@ -0,0 +1,77 @@
+import time
+
+import torch
+
+
+class PoseBatcher(object):
+    """Run the pose model on the crops of several consecutive frames at once.
+
+    Frames with few people give tiny batches, so the crops of consecutive
+    frames are collected until they fill a batch of `batch_size` crops, or
+    `max_frames` frames are pending, or the oldest pending frame has waited
+    `max_delay` seconds. The pose model runs on all the pending crops at
+    once, and the heatmaps are split back to their frames, which are
+    returned in input order. Frames without people are returned in order too,
+    right away if no frame is pending. The delay is checked when frames are
+    added, the caller should also `flush` after waiting `timeout` seconds for
+    the next frame, so that frames do not wait for a stalled input.
+    `max_frames` may be lowered while running, e.g. to the number of frames
+    the caller can hold without starving the pipeline.
+
+    Parameters
+    ----------
+    forward: callable
+        Pose model on a batch of crops, returns their heatmaps. It may split the batch.
+    batch_size: int
+        Number of crops to collect before running the pose model.
+    max_frames: int
+        Maximum number of pending frames, 1 runs the pose model on each frame.
+    max_delay: float
+        Maximum waiting time of a frame in seconds, 0 for no deadline.
+    """
+
+    def __init__(self, forward, batch_size, max_frames=1, max_delay=0):
+        self.forward = forward
+        self.batch_size = batch_size
+        self.max_frames = max(1, max_frames)
+        self.max_delay = max_delay
+        # (frame, crops or None) in input order
+        self.pending = []
+        self.num_crops = 0
+        self.first_time = None
+
+    def add(self, inps, frame):
+        """
+        Add the crops(torch.Tensor,(n,3,h,w)) of the next frame, None if it has no people,
+        return the list of (frame, heatmaps) of the frames done, heatmaps None without people
+        """
+        if inps is None and not self.pending:
+            return [(frame, None)]
+        if not self.pending:
+            self.first_time = time.time()
+        self.pending.append((frame, inps))
+        if inps is not None:
+            self.num_crops += inps.size(0)
+        if self.num_crops >= self.batch_size or len(self.pending) >= self.max_frames or \
+                (self.max_delay > 0 and time.time() - self.first_time >= self.max_delay):
+            return self.flush()
+        return []
+
+    def timeout(self):
+        """Seconds left before the oldest pending frame is due, None if no frame is pending or without deadline"""
+        if not self.pending or self.max_delay <= 0:
+            return None
+        return max(0., self.first_time + self.max_delay - time.time())
+
+    def flush(self):
+        """Run the pose model on all the pending crops, return all the pending frames"""
+        if not self.pending:
+            return []
+        crops = [inps for _, inps in self.pending if inps is not None]
+        if crops:
+            hm = self.forward(torch.cat(crops) if len(crops) > 1 else crops[0])
+            hm = iter(torch.split(hm, [inps.size(0) for inps in crops]))
+        results = [(frame, None if inps is None else next(hm)) for frame, inps in self.pending]
+        self.pending = []
+        self.num_crops = 0
+        return results
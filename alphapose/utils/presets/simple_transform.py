@@ -3,23 +3,20 @@
 # Written by Jiefeng Li (jeff.lee.sjtu@gmail.com)
 # -----------------------------------------------------
 
-import platform
 import random
 
 import cv2
 import numpy as np
 import torch
 
-from ..bbox import (_box_to_center_scale, _center_scale_to_box,
-                    _clip_aspect_ratio)
+from ..bbox import (_box_to_center_scale, _boxes_to_center_scale,
+                    _center_scale_to_box, _clip_aspect_ratio)
 from ..transforms import (addDPG, affine_transform, flip_joints_3d,
-                          get_affine_transform, im_to_torch)
+                          get_affine_transform, get_affine_transform_batch,
+                          im_to_torch, warp_affine_batch, warp_affine_uint8)
 
-# Only windows visual studio 2013 ~2017 support compile c/cuda extensions
-# If you force to compile extension on Windows and ensure appropriate visual studio
-# is intalled, you can try to use these ext_modules.
-if platform.system() != 'Windows':
-    from ..roi_align import RoIAlign
+# RoIAlign falls back to torchvision or pure torch when the extension is not built, e.g. on Windows
+from ..roi_align import RoIAlign
 
 
 class SimpleTransform(object):
@@ -75,10 +72,9 @@ class SimpleTransform(object):
 
             self.upper_body_ids = dataset.upper_body_ids
             self.lower_body_ids = dataset.lower_body_ids
-        if platform.system() != 'Windows':
-            self.roi_align = RoIAlign(self._input_size, sample_num=-1)
-            if gpu_device is not None:
-                self.roi_align = self.roi_align.to(gpu_device)
+        self.roi_align = RoIAlign(self._input_size, sample_num=-1)
+        if gpu_device is not None:
+            self.roi_align = self.roi_align.to(gpu_device)
 
     def test_transform(self, src, bbox):
         xmin, ymin, xmax, ymax = bbox
@@ -100,9 +96,38 @@ class SimpleTransform(object):
 
         return img, bbox
 
+    def test_transform_batch(self, src, bboxes, uint8=False):
+        """
+        Batched `test_transform` of all the boxes of an image: the affine matrices
+        are computed at once and all the boxes are cropped by one `grid_sample`,
+        then the mean is subtracted from all the crops in one pass.
+        With `uint8`, the crops are left as uint8 pixels, 4x smaller to pass between
+        processes, and `normalize_crops` makes them float on the device of the pose model.
+
+        Arguments:
+            src (ndarray [H, W, 3]): input image
+            bboxes (Tensor[K, 4]): the box coordinates in (x1, y1, x2, y2) format
+
+        Returns:
+            inps (Tensor[K, 3, input_size[0], input_size[1]])
+            cropped_boxes (Tensor[K, 4]): box coordinates of the crops
+        """
+        centers, scales = _boxes_to_center_scale(bboxes, self._aspect_ratio)
+        inp_h, inp_w = self._input_size
+        trans = get_affine_transform_batch(centers, scales, [inp_w, inp_h])
+        if uint8:
+            inps = warp_affine_uint8(src, trans, (int(inp_w), int(inp_h)))
+        else:
+            inps = warp_affine_batch(src, trans, (int(inp_w), int(inp_h)), scale=1 / 255.)
+            # the borders outside the image are 0 before the mean subtraction, like in `test_transform`
+            inps.view(len(inps), 3, -1).add_(inps.new_tensor([-0.406, -0.457, -0.480]).view(1, 3, 1))
+        cropped_boxes = torch.from_numpy(np.concatenate((centers - scales * 0.5, centers + scales * 0.5), 1))
+        return inps, cropped_boxes
+
     def align_transform(self, image, boxes):
         """
-        Performs Region of Interest (RoI) Align operator described in Mask R-CNN
+        Performs Region of Interest (RoI) Align operator described in Mask R-CNN,
+        on all the boxes at once. The boxes are enlarged like in `test_transform`.
 
         Arguments:
             input (ndarray [H, W, 3]): input images
@@ -113,13 +138,13 @@ class SimpleTransform(object):
             cropped_img (Tensor[K, C, output_size[0], output_size[1]])
             boxes (Tensor[K, 4]): new box coordinates
         """
-        tensor_img = im_to_torch(image)
-        tensor_img[0].add_(-0.406)
-        tensor_img[1].add_(-0.457)
-        tensor_img[2].add_(-0.480)
+        # the images may be views with negative strides, e.g. flipped from BGR
+        tensor_img = im_to_torch(np.ascontiguousarray(image))
 
-        new_boxes = _clip_aspect_ratio(boxes, self._aspect_ratio)
+        new_boxes = _clip_aspect_ratio(boxes, self._aspect_ratio, scale_mult=1.25)
         cropped_img = self.roi_align(tensor_img.unsqueeze(0).to(self._gpu_device), new_boxes.to(self._gpu_device))
+        # the borders outside the image are 0 before the mean subtraction, like in `test_transform`
+        cropped_img.add_(cropped_img.new_tensor([-0.406, -0.457, -0.480]).view(1, 3, 1, 1))
         return cropped_img, new_boxes[:, 1:]
 
     def _target_generator(self, joints_3d, num_joints):
@@ -0,0 +1,150 @@
+import time
+
+import numpy as np
+import torch.multiprocessing as mp
+
+# counters kept for every queue
+_PUTS, _GETS, _PUT_WAIT, _GET_WAIT = range(4)
+# the counters are allocated up front, since workers may start before all queues are registered
+MAX_QUEUES = 8
+
+
+class QueueMonitor(object):
+    """Depth and wait-time counters of the inference pipeline queues.
+
+    The counters live in shared memory, so they are updated from every
+    worker thread or process. A long put wait means the consumer of a queue
+    is the bottleneck, a long get wait means its producer is.
+
+    The monitor also keeps the number of frames buffered in the pipeline
+    under a memory budget: `acquire_frames` blocks while the frames in flight
+    would exceed the budget, `release_frame` is called once a frame is done.
+    The frame capacity adapts to the measured size of the frames.
+
+    Parameters
+    ----------
+    memory_budget: float
+        Memory budget of the buffered frames in MB, 0 means unlimited.
+    min_frames: int
+        Minimum frame capacity, the frames the pipeline needs in flight to make progress.
+    """
+
+    def __init__(self, memory_budget=0, min_frames=0):
+        self._queues = {}
+        self._counters = mp.Array('d', 4 * MAX_QUEUES)
+        self.memory_budget = memory_budget * 1024 * 1024
+        self.min_frames = min_frames
+        self._cond = mp.Condition()
+        self._frames = mp.Value('q', 0, lock=False)
+        self._frame_bytes = mp.Value('d', 0, lock=False)
+
+    def register(self, name, queue):
+        """Monitor `queue` under `name`, must be called before the workers using it start."""
+        assert len(self._queues) < MAX_QUEUES, 'Cannot monitor more than {} queues'.format(MAX_QUEUES)
+        self._queues[name] = queue
+
+    def _index(self, queue):
+        for i, q in enumerate(self._queues.values()):
+            if q is queue:
+                return i
+        return None
+
+    def _record(self, queue, counter, wait):
+        i = self._index(queue)
+        if i is None:
+            return
+        with self._counters.get_lock():
+            self._counters[4 * i + counter] += 1
+            self._counters[4 * i + counter + 2] += wait
+
+    def put(self, queue, item):
+        start = time.time()
+        queue.put(item)
+        self._record(queue, _PUTS, time.time() - start)
+
+    def get(self, queue, timeout=None):
+        """Get an item of `queue`, raises queue.Empty if none came within `timeout` seconds"""
+        start = time.time()
+        item = queue.get(timeout=timeout)
+        self._record(queue, _GETS, time.time() - start)
+        return item
+
+    def acquire_frames(self, sizes):
+        """Account a batch of frames of `sizes` bytes entering the pipeline, wait while it is over the budget."""
+        with self._cond:
+            # running average of the frame size, which sets how many frames fit in the budget
+            for nbytes in sizes:
+                if self._frame_bytes.value == 0:
+                    self._frame_bytes.value = nbytes
+                else:
+                    self._frame_bytes.value = 0.9 * self._frame_bytes.value + 0.1 * nbytes
+            if self.memory_budget > 0:
+                capacity = self.frame_capacity()
+                # a whole batch is always let in when the pipeline is empty
+                while self._frames.value > 0 and self._frames.value + len(sizes) > capacity:
+                    self._cond.wait()
+            self._frames.value += len(sizes)
+
+    def frame_capacity(self):
+        """
+        Number of frames of the average size that fit in the memory budget, at least `min_frames`,
+        None if unlimited or not known yet.
+        """
+        if self.memory_budget <= 0 or self._frame_bytes.value == 0:
+            return None
+        return max(int(self.memory_budget // self._frame_bytes.value), self.min_frames)
+
+    def release_frame(self):
+        """Account a frame leaving the pipeline."""
+        with self._cond:
+            self._frames.value -= 1
+            self._cond.notify_all()
+
+    def stats(self):
+        """Return a dict with, for every queue: depth, maxsize, puts, gets and the total put/get wait in seconds."""
+        stats = {}
+        with self._counters.get_lock():
+            counters = list(self._counters)
+        for i, (name, queue) in enumerate(self._queues.items()):
+            try:
+                depth = queue.qsize()
+            except NotImplementedError:
+                # qsize is not available on macOS
+                depth = -1
+            stats[name] = {
+                'depth': depth,
+                'maxsize': getattr(queue, '_maxsize', getattr(queue, 'maxsize', 0)),
+                'puts': int(counters[4 * i + _PUTS]),
+                'gets': int(counters[4 * i + _GETS]),
+                'put_wait': counters[4 * i + _PUT_WAIT],
+                'get_wait': counters[4 * i + _GET_WAIT]
+            }
+        stats['frames'] = {
+            'buffered': self._frames.value,
+            'avg_mb': self._frame_bytes.value / 1024 / 1024,
+            'budget_mb': self.memory_budget / 1024 / 1024
+        }
+        return stats
+
+    def summary(self):
+        """Return the stats as printable lines."""
+        stats = self.stats()
+        frames = stats.pop('frames')
+        lines = []
+        for name, s in stats.items():
+            lines.append('{name}: depth {depth}/{maxsize} | put {puts} wait {pw:.2f}s (avg {apw:.4f}s) | '
+                         'get {gets} wait {gw:.2f}s (avg {agw:.4f}s)'.format(
+                             name=name, depth=s['depth'], maxsize=s['maxsize'],
+                             puts=s['puts'], pw=s['put_wait'], apw=s['put_wait'] / max(1, s['puts']),
+                             gets=s['gets'], gw=s['get_wait'], agw=s['get_wait'] / max(1, s['gets'])))
+        lines.append('buffered frames: {buffered} | avg frame size: {avg_mb:.2f}MB | memory budget: {budget}'.format(
+            buffered=frames['buffered'], avg_mb=frames['avg_mb'],
+            budget='{:.0f}MB'.format(frames['budget_mb']) if frames['budget_mb'] > 0 else 'unlimited'))
+        return lines
+
+
+def frame_nbytes(frame):
+    """Size in bytes of a frame, given as ndarray or as a handle with a `shape`."""
+    if isinstance(frame, np.ndarray):
+        return frame.nbytes
+    return int(np.prod(frame.shape))
@@ -1,3 +1,3 @@
-from .roi_align import roi_align, RoIAlign
+from .roi_align import roi_align, roi_align_torch, RoIAlign
 
-__all__ = ['roi_align', 'RoIAlign']
+__all__ = ['roi_align', 'roi_align_torch', 'RoIAlign']
@@ -1,9 +1,19 @@
+import torch
 import torch.nn as nn
+import torch.nn.functional as F
 from torch.autograd import Function
 from torch.autograd.function import once_differentiable
 from torch.nn.modules.utils import _pair
 
-from . import roi_align_cuda
+# the compiled extension is optional, e.g. it is not built on Windows or CPU only machines
+try:
+    from . import roi_align_cuda
+except ImportError:
+    roi_align_cuda = None
+try:
+    from torchvision.ops import roi_align as tv_roi_align
+except ImportError:
+    tv_roi_align = None
 
 
 class RoIAlignFunction(Function):
@@ -56,28 +66,125 @@ class RoIAlignFunction(Function):
 roi_align = RoIAlignFunction.apply
 
 
+# bilinear samples taken at once by `roi_align_torch`, bounds the size of the sampling grids
+ROI_ALIGN_MAX_SAMPLES = 1 << 22
+
+
+def roi_align_torch(features, rois, out_size, spatial_scale=1, sample_num=0):
+    """
+    RoIAlign in pure torch, for CPU tensors or when the extension is not built,
+    with the sampling of the compiled op: each output bin is the mean of a regular grid
+    of bilinear samples, `sample_num` per side, or ceil(roi size / out size) if it is not
+    positive. The rois with the same numbers of samples are sampled by one `grid_sample`.
+
+    Arguments:
+        features (Tensor[N, C, H, W]): feature maps
+        rois (Tensor[K, 5]): (batch index, x1, y1, x2, y2) of each roi, in input coordinates
+        out_size (int or tuple): output size, as (height, width)
+
+    Returns:
+        output (Tensor[K, C, out_size[0], out_size[1]])
+    """
+    out_h, out_w = _pair(out_size)
+    num_rois = rois.size(0)
+    channels = features.size(1)
+    if num_rois == 0:
+        return features.new_zeros(0, channels, out_h, out_w)
+    rois = rois.to(features.dtype)
+    # (x, y) of the rois, the end pixels are inside the rois like in the compiled op
+    starts = rois[:, 1:3] * spatial_scale
+    sizes = ((rois[:, 3:5] + 1) * spatial_scale - starts).clamp(min=0)
+    bins = sizes / sizes.new_tensor([out_w, out_h])
+    if sample_num > 0:
+        samples = torch.full_like(bins, sample_num)
+    else:
+        samples = torch.ceil(bins).clamp(min=1)
+
+    groups = {}
+    for k, num in enumerate(samples.long().tolist()):
+        groups.setdefault(tuple(num), []).append(k)
+    if len(groups) == 1 and num_rois * out_h * out_w * samples[0].prod() <= ROI_ALIGN_MAX_SAMPLES:
+        return _roi_align_samples(features, rois[:, 0], starts, bins, (out_h, out_w), next(iter(groups)))
+    output = features.new_empty(num_rois, channels, out_h, out_w)
+    for num, inds in groups.items():
+        chunk = max(1, ROI_ALIGN_MAX_SAMPLES // (out_h * out_w * num[0] * num[1]))
+        for begin in range(0, len(inds), chunk):
+            idx = torch.tensor(inds[begin:begin + chunk], device=rois.device)
+            output[idx] = _roi_align_samples(features, rois[idx, 0], starts[idx], bins[idx], (out_h, out_w), num)
+    return output
+
+
+def _roi_align_samples(features, batch_inds, starts, bins, out_size, num_samples):
+    """RoIAlign of rois with `num_samples` (x, y) samples per bin, see `roi_align_torch`"""
+    out_h, out_w = out_size
+    num_x, num_y = num_samples
+    num_rois = starts.size(0)
+    _, channels, height, width = features.size()
+
+    def axis_samples(axis, out_dim, num, dim):
+        # coords (K, out_dim * num) of the samples along one axis and their weights in the mean
+        pos = torch.arange(out_dim, dtype=starts.dtype, device=starts.device)
+        sub = torch.arange(num, dtype=starts.dtype, device=starts.device)
+        bin_size = bins[:, axis, None, None]
+        coords = starts[:, axis, None, None] + pos[:, None] * bin_size + (sub + 0.5) * bin_size / num
+        # samples out of the features are 0 in the compiled op
+        weights = ((coords >= -1) & (coords <= dim)).to(starts.dtype) / num
+        # normalized coords of the pixel centers, grid_sample clamps the samples within 1 pixel of the border
+        coords = coords * (2. / max(dim - 1, 1)) - 1
+        return coords.view(num_rois, -1), weights
+
+    grid_x, weights_x = axis_samples(0, out_w, num_x, width)
+    grid_y, weights_y = axis_samples(1, out_h, num_y, height)
+    grid = torch.stack((grid_x[:, None, :].expand(-1, grid_y.size(1), -1),
+                        grid_y[:, :, None].expand(-1, -1, grid_x.size(1))), 3)
+
+    if features.size(0) == 1:
+        # all the rois sample the same features, without copying them
+        features = features.expand(num_rois, -1, -1, -1)
+    else:
+        features = features[batch_inds.long()]
+    values = F.grid_sample(features, grid, mode='bilinear', padding_mode='border', align_corners=True)
+    values = values.view(num_rois, channels, out_h, num_y, out_w, num_x)
+    return torch.einsum('kchypx,khy,kpx->kchp', values, weights_y, weights_x)
+
+
 class RoIAlign(nn.Module):
 
+    """
+    RoIAlign of Mask R-CNN, by the compiled extension for CUDA tensors when it is built,
+    by `torchvision.ops.roi_align` if `use_torchvision`, else by `roi_align_torch`.
+    `use_torchvision` None picks torchvision when it is installed.
+    All the backends sample the rois the same way.
+    """
+
     def __init__(self,
                  out_size,
                  spatial_scale=1,
                  sample_num=0,
-                 use_torchvision=False):
+                 use_torchvision=None):
         super(RoIAlign, self).__init__()
 
         self.out_size = out_size
         self.spatial_scale = float(spatial_scale)
         self.sample_num = int(sample_num)
+        if use_torchvision is None:
+            use_torchvision = tv_roi_align is not None
+        elif use_torchvision and tv_roi_align is None:
+            raise ImportError('use_torchvision requires torchvision')
         self.use_torchvision = use_torchvision
 
     def forward(self, features, rois):
         if self.use_torchvision:
-            from torchvision.ops import roi_align as tv_roi_align
+            # torchvision excludes the end pixels from the rois, unlike the compiled op
+            rois = torch.cat((rois[:, :3], rois[:, 3:5] + 1), 1)
             return tv_roi_align(features, rois, _pair(self.out_size),
                                 self.spatial_scale, self.sample_num)
-        else:
+        elif features.is_cuda and roi_align_cuda is not None:
             return roi_align(features, rois, self.out_size, self.spatial_scale,
                              self.sample_num)
+        else:
+            return roi_align_torch(features, rois, self.out_size, self.spatial_scale,
+                                   self.sample_num)
 
     def __repr__(self):
         format_str = self.__class__.__name__
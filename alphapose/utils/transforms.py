@@ -702,6 +702,153 @@ def get_affine_transform(center,
     return trans
 
 
+def get_affine_transform_batch(centers, scales, output_size):
+    """Vectorized `get_affine_transform` of many boxes, without rotation nor shift.
+
+    Parameters
+    ----------
+    centers: numpy.ndarray
+        Box centers with shape: `(K, 2)`.
+    scales: numpy.ndarray
+        Box sizes with shape: `(K, 2)`, only the width is used like in `get_affine_transform`.
+    output_size: tuple
+        Output size, as (width, height).
+
+    Returns
+    -------
+    numpy.ndarray
+        Affine matrices from the image to the outputs with shape: `(K, 2, 3)`.
+
+    """
+    dst_w, dst_h = output_size
+    # the source width is mapped to the output width, with the box center at the output center
+    ratio = dst_w / scales[:, 0].astype(np.float64)
+    trans = np.zeros((len(centers), 2, 3), dtype=np.float64)
+    trans[:, 0, 0] = ratio
+    trans[:, 1, 1] = ratio
+    trans[:, 0, 2] = dst_w * 0.5 - ratio * centers[:, 0]
+    trans[:, 1, 2] = dst_h * 0.5 - ratio * centers[:, 1]
+    return trans
+
+
+def warp_affine_batch(img, trans, output_size, scale=1.):
+    """Warp one image to many outputs at once, like `cv2.warpAffine` with
+    bilinear interpolation and a zero border, with `grid_sample`.
+    Only the part of the image under the outputs is converted to float.
+
+    Parameters
+    ----------
+    img: numpy.ndarray
+        An ndarray with shape: `(H, W, C)`.
+    trans: numpy.ndarray
+        Affine matrices from the image to the outputs with shape: `(K, 2, 3)`.
+    output_size: tuple
+        Output size, as (width, height).
+    scale: float
+        Factor of the pixel values, applied to the image region while it is converted to float.
+
+    Returns
+    -------
+    torch.Tensor
+        A float tensor with shape: `(K, C, height, width)`.
+
+    """
+    out_w, out_h = output_size
+    num = trans.shape[0]
+    img_h, img_w, channels = img.shape
+    # affine matrices from the outputs to the image
+    inv_mat = np.linalg.inv(trans[:, :, :2])
+    inv_off = -np.einsum('kij,kj->ki', inv_mat, trans[:, :, 2])
+
+    # image region under the outputs, with a margin for the bilinear neighbours
+    corners = np.array([[-0.5, -0.5], [out_w - 0.5, -0.5], [-0.5, out_h - 0.5], [out_w - 0.5, out_h - 0.5]])
+    src_corners = np.einsum('kij,cj->kci', inv_mat, corners) + inv_off[:, None]
+    x0, y0 = np.maximum(np.floor(src_corners.min((0, 1))).astype(int) - 1, 0)
+    x1, y1 = np.minimum(np.ceil(src_corners.max((0, 1))).astype(int) + 2, [img_w, img_h])
+    if x1 <= x0 or y1 <= y0:
+        return torch.zeros(num, channels, out_h, out_w)
+    region = torch.from_numpy(np.ascontiguousarray(img[y0:y1, x0:x1])).permute(2, 0, 1).float()
+    if scale != 1:
+        region.mul_(scale)
+    reg_h, reg_w = region.shape[1:]
+    inv_off -= np.array([x0, y0])
+
+    # output normalized coords -> output pixels -> region pixels -> region normalized coords
+    out_scale = np.array([out_w / 2, out_h / 2])
+    out_off = np.array([(out_w - 1) / 2, (out_h - 1) / 2])
+    reg_scale = np.array([2 / reg_w, 2 / reg_h])
+    reg_off = np.array([1 / reg_w - 1, 1 / reg_h - 1])
+    theta = np.empty((num, 2, 3))
+    theta[:, :, :2] = reg_scale[:, None] * inv_mat * out_scale
+    theta[:, :, 2] = reg_scale * (np.einsum('kij,j->ki', inv_mat, out_off) + inv_off) + reg_off
+
+    theta = torch.from_numpy(theta).float()
+    if np.any(inv_mat[:, 0, 1] != 0) or np.any(inv_mat[:, 1, 0] != 0):
+        grid = torch.nn.functional.affine_grid(theta, (num, channels, out_h, out_w), align_corners=False)
+    else:
+        # without rotation, the x coords only depend on the output column and the y coords on the row,
+        # which is much cheaper than the matrix product of affine_grid
+        grid = torch.empty(num, out_h, out_w, 2)
+        grid_x = (torch.arange(out_w, dtype=torch.float32) * 2 + 1) / out_w - 1
+        grid_y = (torch.arange(out_h, dtype=torch.float32) * 2 + 1) / out_h - 1
+        grid[..., 0] = (theta[:, 0, 0, None] * grid_x + theta[:, 0, 2, None])[:, None, :]
+        grid[..., 1] = (theta[:, 1, 1, None] * grid_y + theta[:, 1, 2, None])[:, :, None]
+    # all the outputs sample the same region, without copying it
+    return torch.nn.functional.grid_sample(region.unsqueeze(0).expand(num, -1, -1, -1), grid,
+                                           mode='bilinear', padding_mode='zeros', align_corners=False)
+
+
+def warp_affine_uint8(img, trans, output_size):
+    """Warp one uint8 image to many uint8 outputs, by `cv2.warpAffine` into one buffer.
+
+    Parameters
+    ----------
+    img: numpy.ndarray
+        An uint8 ndarray with shape: `(H, W, 3)`, possibly a channel reversed view.
+    trans: numpy.ndarray
+        Affine matrices from the image to the outputs with shape: `(K, 2, 3)`.
+    output_size: tuple
+        Output size, as (width, height).
+
+    Returns
+    -------
+    torch.Tensor
+        An uint8 tensor with shape: `(K, 3, height, width)`, a channels last view of the buffer.
+
+    """
+    out_w, out_h = output_size
+    crops = np.empty((trans.shape[0], out_h, out_w, 3), dtype=np.uint8)
+    # cv2 would copy a whole channel reversed image for each warp, the crops are reversed instead
+    reversed_channels = img.strides[2] < 0
+    if reversed_channels:
+        img = img[:, :, ::-1]
+    for k in range(trans.shape[0]):
+        cv2.warpAffine(img, trans[k], (out_w, out_h), dst=crops[k], flags=cv2.INTER_LINEAR)
+    if reversed_channels:
+        crops[:] = crops[..., ::-1]
+    return torch.from_numpy(crops).permute(0, 3, 1, 2)
+
+
+def normalize_crops(inps):
+    """Float conversion and mean subtraction of uint8 crops, on their device.
+
+    Parameters
+    ----------
+    inps: torch.Tensor
+        Crops with shape: `(N, 3, H, W)`, float crops are returned as they are.
+
+    Returns
+    -------
+    torch.Tensor
+        A float tensor with shape: `(N, 3, H, W)`.
+
+    """
+    if inps.dtype != torch.uint8:
+        return inps
+    inps = inps.float().mul_(1 / 255.)
+    return inps.add_(inps.new_tensor([-0.406, -0.457, -0.480]).view(1, 3, 1, 1))
+
+
 def affine_transform(pt, t):
     new_pt = np.array([pt[0], pt[1], 1.]).T
     new_pt = np.dot(t, new_pt)
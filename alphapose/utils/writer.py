@@ -24,10 +24,12 @@ EVAL_JOINTS = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16]
 class DataWriter():
     def __init__(self, cfg, opt, save_video=False,
                  video_save_opt=DEFAULT_VIDEO_SAVE_OPT,
-                 queueSize=1024):
+                 queueSize=1024, frame_buffer=None, monitor=None):
         self.cfg = cfg
         self.opt = opt
         self.video_save_opt = video_save_opt
+        # shared memory buffer holding the original images, see `DetectionLoader`
+        self.frame_buffer = frame_buffer
 
         self.eval_joints = EVAL_JOINTS
         self.save_video = save_video
@@ -42,6 +44,11 @@ class DataWriter():
             self.result_queue = mp.Queue(maxsize=queueSize)
             self.final_result_queue = mp.Queue(maxsize=queueSize)
 
+        # queue counters and memory budget shared with `DetectionLoader`
+        self.monitor = monitor
+        if monitor is not None:
+            monitor.register('result_queue', self.result_queue)
+
         if opt.save_img:
             if not os.path.exists(opt.outputpath + '/vis'):
                 os.mkdir(opt.outputpath + '/vis')
@@ -86,6 +93,12 @@ class DataWriter():
                 if self.save_video:
                     stream.release()
                 return
+            if self.monitor is not None:
+                # the frame leaves the buffered part of the pipeline
+                self.monitor.release_frame()
+            if self.frame_buffer is not None:
+                # copy the image out of shared memory and free its slot for the next frames
+                orig_img = self.frame_buffer.take(orig_img)
             # image channel RGB->BGR
             orig_img = np.array(orig_img, dtype=np.uint8)[:, :, ::-1]
             if boxes is None:
@@ -132,14 +145,23 @@ class DataWriter():
             cv2.imshow("AlphaPose Demo", img)
             cv2.waitKey(30)
         if self.opt.save_img:
-            cv2.imwrite(os.path.join(self.opt.outputpath, 'vis', im_name), img)
+            # the name may be a path in the sub-directories of the input directory
+            path = os.path.join(self.opt.outputpath, 'vis', im_name)
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            cv2.imwrite(path, img)
         if self.save_video:
             stream.write(img)
 
     def wait_and_put(self, queue, item):
-        queue.put(item)
+        if self.monitor is not None:
+            self.monitor.put(queue, item)
+        else:
+            queue.put(item)
 
     def wait_and_get(self, queue):
+        if self.monitor is not None:
+            return self.monitor.get(queue)
         return queue.get()
 
     def save(self, boxes, scores, ids, hm_data, cropped_boxes, orig_img, im_name):
@@ -4,8 +4,12 @@
 # -----------------------------------------------------
 
 """API of detector"""
+import math
 from abc import ABC, abstractmethod
 
+import numpy as np
+import torch
+
 
 def get_detector(opt=None):
     if opt.detector == 'yolo':
@@ -20,18 +24,134 @@ def get_detector(opt=None):
         raise NotImplementedError
 
 
+def unletterbox_boxes(boxes, inp_size, orig_dims):
+    """
+    Map boxes from the letterboxed network input back to their original images,
+    and clip them to the images, for all the boxes at once
+    Input: boxes(torch.Tensor,(n,(x1,y1,x2,y2))): boxes in the network input, updated in place
+           inp_size(int or (w,h)): size of the network input
+           orig_dims(torch.Tensor,(n,(w,h,...)) or (w,h,...)): size of the original image of each box
+    Output: boxes
+    """
+    inp_size = boxes.new_tensor(inp_size).expand(2)
+    orig_dims = orig_dims.to(boxes).view(-1, orig_dims.shape[-1])[:, :2]
+    scaling_factor = torch.min(inp_size / orig_dims, 1, keepdim=True)[0]
+    pad = (inp_size - scaling_factor * orig_dims) / 2
+    boxes -= pad.repeat(1, 2)
+    boxes /= scaling_factor
+    boxes.copy_(torch.min(boxes.clamp(min=0), orig_dims.repeat(1, 2)))
+    return boxes
+
+
+def image_tiles(img_w, img_h, tile_dim, overlap=0.2):
+    """
+    Overlapping square tiles covering an image. Along each side, the tiles are spread evenly,
+    and their number is the smallest one for which they overlap by at least `overlap` of their side.
+    Sides up to `tile_dim` pixels are covered by a single tile.
+    Output: list of tiles (x0,y0,x1,y1) in pixels
+    """
+    def spans(side):
+        if side <= tile_dim:
+            return [(0, side)]
+        num = int(math.ceil((side - tile_dim) / (tile_dim * (1 - overlap)))) + 1
+        starts = [int(round(i * (side - tile_dim) / (num - 1))) for i in range(num)]
+        return [(start, start + tile_dim) for start in starts]
+
+    return [(x0, y0, x1, y1) for y0, y1 in spans(img_h) for x0, x1 in spans(img_w)]
+
+
 class BaseDetector(ABC):
     def __init__(self):
         pass
 
+    def input_size(self, img_w, img_h):
+        """
+        Network input size (w,h) fitting an image of size `img_w` x `img_h`, so that images
+        can be letterboxed to rectangles and batched by size, None if the input size is fixed
+        """
+        return None
+
+    def tiled(self):
+        """
+        Whether high resolution images are detected on tiles with `tiles_detection`,
+        which needs the original images, instead of with `images_detection`
+        """
+        return False
+
+    def tiles_detection(self, imgs, orig_imgs, orig_dim_list, batch_size=None):
+        """
+        Detect people on tiles of the original images, see `tiled`
+        By default the images are not tiled and are detected with `images_detection`
+        Input: imgs(torch.FloatTensor,(b,3,h,w)): pre-processed mini-batch image input
+               orig_imgs: list of the original images(ndarray,channel BGR)
+               orig_dim_list(torch.FloatTensor, (b,(w,h,w,h))): original mini-batch image size
+               batch_size(int): number of tiles per network batch
+        Output: dets(torch.FloatTensor,(n,(batch_idx,x1,y1,x2,y2,c,s,idx of cls))) or 0 if none
+        """
+        return self.images_detection(imgs, orig_dim_list)
+
     @abstractmethod
-    def image_preprocess(self, img_name):
+    def image_preprocess(self, img_source, return_orig=False, inp_size=None):
+        """
+        Pre-process the img before fed to the object detection network
+        If `return_orig` is True, the decoded original image(ndarray,channel BGR)
+        is returned along with the pre-processed one, so that callers do not
+        have to read the image from disk again.
+        `inp_size` is an input size given by `input_size`, if any.
+        """
         pass
 
+    def images_preprocess(self, img_sources, inp_size=None):
+        """
+        Pre-process a mini-batch of images before fed to the object detection network
+        Input: list of image names(str) or raw image data(ndarray,channel BGR)
+               inp_size((w,h)): input size given by `input_size`, if any
+        Output: pre-processed images(torch.FloatTensor,(b,3,h,w)),
+                list of decoded original images(ndarray,channel BGR)
+        """
+        imgs = []
+        orig_imgs = []
+        # detectors without `input_size` may not take an input size
+        kwargs = {} if inp_size is None else {'inp_size': inp_size}
+        for img_source in img_sources:
+            img, orig_img = self.image_preprocess(img_source, return_orig=True, **kwargs)
+            if isinstance(img, np.ndarray):
+                img = torch.from_numpy(img)
+            # add one dimension at the front for batch if image shape (3,h,w)
+            if img.dim() == 3:
+                img = img.unsqueeze(0)
+            imgs.append(img)
+            orig_imgs.append(orig_img)
+        return torch.cat(imgs), orig_imgs
+
     @abstractmethod
     def images_detection(self, imgs, orig_dim_list):
         pass
 
+    def images_propagation(self, dets, orig_dim_list):
+        """
+        Detections of frames skipped by the detector because they barely changed,
+        by default the detections of the last detected frame are reused
+        Input: dets(torch.FloatTensor,(n,(batch_idx,x1,y1,x2,y2,...))): detections of the last detected frame or None
+               orig_dim_list(torch.FloatTensor, (b,(w,h,w,h))): original size of the skipped frames
+        Output: dets of the skipped frames, same format as `images_detection`
+        """
+        if dets is None or dets.shape[0] == 0:
+            return 0
+        num_dets = dets.shape[0]
+        dets = dets.repeat(len(orig_dim_list), 1)
+        dets[:, 0] = torch.arange(len(orig_dim_list), dtype=dets.dtype).repeat_interleave(num_dets)
+        return dets
+
+    def cache_config(self):
+        """
+        Settings the detections depend on, e.g. weights and thresholds, so that detections
+        cached for an image are only reused with the same settings, see `DetectionCache`.
+        None if the detections also depend on the previous images, e.g. when tracking,
+        and cannot be cached.
+        """
+        return None
+
     @abstractmethod
     def detect_one_img(self, img_name):
         pass
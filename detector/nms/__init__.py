@@ -1,3 +1,5 @@
-from .nms_wrapper import nms, soft_nms
+from .nms_wrapper import (nms, soft_nms, batched_soft_nms, batched_matrix_nms, set_nms_backend,
+                          get_nms_backend, NMS_BACKENDS, SOFT_NMS_METHODS)
 
-__all__ = ['nms', 'soft_nms']
+__all__ = ['nms', 'soft_nms', 'batched_soft_nms', 'batched_matrix_nms', 'set_nms_backend',
+           'get_nms_backend', 'NMS_BACKENDS', 'SOFT_NMS_METHODS']
@@ -1,16 +1,129 @@
 import numpy as np
 import torch
 
-from . import nms_cpu, nms_cuda
-from .soft_nms_cpu import soft_nms_cpu
+# the compiled extensions are optional, e.g. they are not built on Windows
+try:
+    from . import nms_cpu
+except ImportError:
+    nms_cpu = None
+try:
+    from . import nms_cuda
+except ImportError:
+    nms_cuda = None
+try:
+    from .soft_nms_cpu import soft_nms_cpu
+except ImportError:
+    soft_nms_cpu = None
+try:
+    from torchvision.ops import nms as torchvision_nms
+except ImportError:
+    torchvision_nms = None
+
+# boxes processed at once by the pure torch NMS, bounds the size of the IoU matrices
+NMS_BLOCK_SIZE = 512
+
+# available NMS implementations, each takes dets(torch.Tensor,(n,(x1,y1,x2,y2,score))) and
+# an IoU threshold, and returns the indices of the kept boxes
+NMS_BACKENDS = {}
+
+
+def register_nms_backend(name):
+    def _register(func):
+        NMS_BACKENDS[name] = func
+        return func
+    return _register
+
+
+def box_iou(boxes1, boxes2):
+    """
+    IoU matrix of two sets of boxes (...,n,(x1,y1,x2,y2)) and (...,m,(x1,y1,x2,y2)),
+    with the +1 pixel convention of the compiled NMS. Leading dimensions are batch dimensions.
+    """
+    area1 = (boxes1[..., 2] - boxes1[..., 0] + 1) * (boxes1[..., 3] - boxes1[..., 1] + 1)
+    area2 = (boxes2[..., 2] - boxes2[..., 0] + 1) * (boxes2[..., 3] - boxes2[..., 1] + 1)
+    lt = torch.max(boxes1[..., :, None, :2], boxes2[..., None, :, :2])
+    rb = torch.min(boxes1[..., :, None, 2:4], boxes2[..., None, :, 2:4])
+    wh = (rb - lt + 1).clamp(min=0)
+    inter = wh[..., 0] * wh[..., 1]
+    return inter / (area1[..., :, None] + area2[..., None, :] - inter)
+
+
+if nms_cpu is not None:
+    @register_nms_backend('compiled')
+    def compiled_nms(dets, iou_thr):
+        """
+        NMS of the compiled extension. `nms` passes tensors on cpu, only numpy boxes given
+        a `device_id` reach the cuda kernel, when it is built.
+        """
+        if dets.is_cuda and nms_cuda is not None:
+            return nms_cuda.nms(dets, iou_thr)
+        return nms_cpu.nms(dets.cpu(), iou_thr)
+
+
+if torchvision_nms is not None:
+    @register_nms_backend('torchvision')
+    def tv_nms(dets, iou_thr):
+        # shift the bottom right corner, so that IoUs follow the +1 pixel convention
+        boxes = dets[:, :4].clone()
+        boxes[:, 2:] += 1
+        return torchvision_nms(boxes, dets[:, 4], iou_thr)
+
+
+@register_nms_backend('torch')
+def torch_nms(dets, iou_thr, block_size=NMS_BLOCK_SIZE):
+    """
+    Greedy NMS with IoU matrices, on any device and without compiled code.
+
+    The boxes are sorted by score and processed in blocks. A block is first
+    suppressed by the boxes kept in the previous blocks, then the greedy
+    suppression within the block is solved by iterating until it is stable,
+    which gives the same boxes as the sequential algorithm.
+    """
+    order = torch.sort(dets[:, 4], descending=True)[1]
+    boxes = dets[order, :4]
+    keep = torch.zeros(boxes.shape[0], dtype=torch.bool, device=boxes.device)
+    for start in range(0, boxes.shape[0], block_size):
+        block = boxes[start:start + block_size]
+        kept_boxes = boxes[:start][keep[:start]]
+        if kept_boxes.shape[0] > 0:
+            alive = (box_iou(kept_boxes, block) < iou_thr).all(0)
+        else:
+            alive = torch.ones(block.shape[0], dtype=torch.bool, device=boxes.device)
+        # overlaps[i, j]: box i is before box j and suppresses it if it is kept
+        overlaps = (box_iou(block, block) >= iou_thr).triu(1)
+        block_keep = alive
+        while True:
+            new_keep = alive & ~(overlaps & block_keep[:, None]).any(0)
+            if torch.equal(new_keep, block_keep):
+                break
+            block_keep = new_keep
+        keep[start:start + block_size] = block_keep
+    return order[keep]
+
+
+# the fastest available backend is chosen at import time, see `set_nms_backend`
+_nms_backend = next(name for name in ('compiled', 'torchvision', 'torch') if name in NMS_BACKENDS)
+
+
+def set_nms_backend(name):
+    """Select the NMS implementation used by `nms`, one of `NMS_BACKENDS`"""
+    global _nms_backend
+    if name not in NMS_BACKENDS:
+        raise ValueError('NMS backend {} is not available, options: {}'.format(name, list(NMS_BACKENDS)))
+    _nms_backend = name
+
+
+def get_nms_backend():
+    return _nms_backend
 
 
 def nms(dets, iou_thr, device_id=None):
     """Dispatch to either CPU or GPU NMS implementations.
 
-    The input can be either a torch tensor or numpy array. GPU NMS will be used
-    if the input is a gpu tensor or device_id is specified, otherwise CPU NMS
-    will be used. The returned type will always be the same as inputs.
+    The input can be either a torch tensor or numpy array. With the compiled
+    backend, GPU NMS will be used if the input is a numpy array and device_id
+    is specified, tensors are suppressed on cpu. The other backends run on the
+    device of the tensor. The returned type will always be the same as inputs.
 
     Arguments:
         dets (torch.Tensor or np.ndarray): bboxes with scores.
@@ -25,7 +138,8 @@ def nms(dets, iou_thr, device_id=None):
     # convert dets (tensor or numpy array) to tensor
     if isinstance(dets, torch.Tensor):
         is_numpy = False
-        dets_th = dets.to('cpu')
+        # the compiled NMS always runs tensors on cpu, as it always did, the other backends run on their device
+        dets_th = dets.to('cpu') if _nms_backend == 'compiled' else dets
     elif isinstance(dets, np.ndarray):
         is_numpy = True
         device = 'cpu' if device_id is None else 'cuda:{}'.format(device_id)
@@ -35,20 +149,129 @@ def nms(dets, iou_thr, device_id=None):
             'dets must be either a Tensor or numpy array, but got {}'.format(
                 type(dets)))
 
-    # execute cpu or cuda nms
+    # execute nms with the selected backend
     if dets_th.shape[0] == 0:
         inds = dets_th.new_zeros(0, dtype=torch.long)
     else:
-        if dets_th.is_cuda:
-            inds = nms_cuda.nms(dets_th, iou_thr)
-        else:
-            inds = nms_cpu.nms(dets_th, iou_thr)
+        inds = NMS_BACKENDS[_nms_backend](dets_th, iou_thr)
 
     if is_numpy:
         inds = inds.cpu().numpy()
     return dets[inds, :], inds
 
 
+def pad_batches(dets, batch_inds):
+    """
+    Gather the boxes of each image into a padded batch, sorted by decreasing score
+    Input: dets(torch.Tensor,(n,(x1,y1,x2,y2,score))), batch_inds(torch.LongTensor,(n,)): image of each box
+    Output: boxes(b,m,4), scores(b,m) and index(b,m) of each box in `dets`, -1 for the padding
+    """
+    scores = dets[:, 4]
+    # sort by image, then by decreasing score within each image
+    key = batch_inds.to(scores.dtype) * (scores.max() - scores.min() + 1) - scores
+    order = torch.sort(key)[1]
+    batch_inds = batch_inds[order]
+    counts = torch.bincount(batch_inds)
+    starts = torch.cumsum(counts, 0) - counts
+    pos = torch.arange(order.shape[0], device=dets.device) - starts[batch_inds]
+
+    num_imgs, max_boxes = counts.shape[0], int(counts.max())
+    boxes = dets.new_zeros(num_imgs, max_boxes, 4)
+    boxes[batch_inds, pos] = dets[order, :4]
+    padded_scores = dets.new_zeros(num_imgs, max_boxes)
+    padded_scores[batch_inds, pos] = scores[order]
+    index = order.new_full((num_imgs, max_boxes), -1)
+    index[batch_inds, pos] = order
+    return boxes, padded_scores, index
+
+
+def score_decay(ious, iou_thr, kernel='gaussian', sigma=0.5):
+    """Decay of the scores of boxes overlapping a better box by `ious`, as in Soft-NMS"""
+    if kernel == 'linear':
+        return torch.where(ious > iou_thr, 1 - ious, torch.ones_like(ious))
+    elif kernel == 'gaussian':
+        return torch.exp(-ious ** 2 / sigma)
+    raise ValueError('Invalid kernel for soft NMS: {}'.format(kernel))
+
+
+def batched_soft_nms(dets, batch_inds, iou_thr, kernel='gaussian', sigma=0.5, min_score=1e-3):
+    """
+    Soft-NMS of the boxes of all the images at once.
+
+    The greedy selection is sequential, but each step picks the best box of
+    every image and decays the scores of all the others with tensor ops, so
+    the number of steps is the number of boxes of the largest image.
+
+    Input: dets(torch.Tensor,(n,(x1,y1,x2,y2,score))), batch_inds(torch.LongTensor,(n,)): image of each box
+    Output: scores(torch.Tensor,(k,)): decayed scores of the kept boxes, inds(torch.LongTensor,(k,)):
+            indices of the kept boxes in `dets`, by image and in selection order
+    """
+    if dets.shape[0] == 0:
+        return dets.new_zeros(0), batch_inds.new_zeros(0)
+    boxes, scores, index = pad_batches(dets, batch_inds)
+    ious = box_iou(boxes, boxes)
+    rows = torch.arange(boxes.shape[0], device=dets.device)
+    remaining = index >= 0
+    # selection step of each kept box, -1 if it is not kept
+    picked = torch.full_like(index, -1)
+    for step in range(boxes.shape[1]):
+        active = remaining.any(1)
+        if not active.any():
+            break
+        best = scores.masked_fill(~remaining, float('-inf')).max(1)[1]
+        picked[rows[active], best[active]] = step
+        remaining[rows, best] = False
+        decay = score_decay(ious[rows, best], iou_thr, kernel, sigma)
+        scores = torch.where(remaining, scores * decay, scores)
+        remaining &= scores >= min_score
+
+    kept = picked >= 0
+    order = torch.sort((rows[:, None] * boxes.shape[1] + picked)[kept])[1]
+    return scores[kept][order], index[kept][order]
+
+
+def batched_matrix_nms(dets, batch_inds, iou_thr=None, kernel='gaussian', sigma=0.5, min_score=1e-3):
+    """
+    Matrix NMS (SOLOv2) of the boxes of all the images at once.
+
+    The score of each box is decayed by all the better boxes in parallel,
+    each decay being compensated by how much that better box is itself
+    suppressed, so there is no sequential step at all. `iou_thr` is unused,
+    the linear kernel decays any overlap.
+
+    Input and output are the same as `batched_soft_nms`, kept boxes are sorted
+    by image and by decreasing score.
+    """
+    if dets.shape[0] == 0:
+        return dets.new_zeros(0), batch_inds.new_zeros(0)
+    boxes, scores, index = pad_batches(dets, batch_inds)
+    valid = index >= 0
+    # ious[b, i, j]: IoU of box j with the better box i
+    ious = box_iou(boxes, boxes).triu(1) * (valid[:, :, None] & valid[:, None, :])
+    # how much each box is suppressed itself
+    ious_cmax = ious.max(1)[0][:, :, None]
+    if kernel == 'linear':
+        decay = (1 - ious) / (1 - ious_cmax).clamp(min=1e-6)
+    elif kernel == 'gaussian':
+        decay = torch.exp(-(ious ** 2 - ious_cmax ** 2) / sigma)
+    else:
+        raise ValueError('Invalid kernel for matrix NMS: {}'.format(kernel))
+    scores = scores * decay.min(1)[0]
+
+    kept = valid & (scores >= min_score)
+    rows = torch.arange(boxes.shape[0], device=dets.device)[:, None].expand_as(index)
+    scores, index, rows = scores[kept], index[kept], rows[kept]
+    order = torch.sort(rows.to(scores.dtype) * (scores.max() - scores.min() + 1) - scores)[1]
+    return scores[order], index[order]
+
+
+# NMS methods that decay the scores instead of dropping the boxes, selected by NMS_METHOD in the detector configs
+SOFT_NMS_METHODS = {
+    'soft_nms': batched_soft_nms,
+    'matrix_nms': batched_matrix_nms
+}
+
+
 def soft_nms(dets, iou_thr, method='linear', sigma=0.5, min_score=1e-3):
     if isinstance(dets, torch.Tensor):
         is_tensor = True
@@ -64,6 +287,18 @@ def soft_nms(dets, iou_thr, method='linear', sigma=0.5, min_score=1e-3):
     method_codes = {'linear': 1, 'gaussian': 2}
     if method not in method_codes:
         raise ValueError('Invalid method for SoftNMS: {}'.format(method))
+
+    if soft_nms_cpu is None:
+        # same results with the vectorized implementation, on the device of the input
+        dets_th = dets if is_tensor else torch.from_numpy(dets_np)
+        scores, inds = batched_soft_nms(
+            dets_th[:, :5], dets_th.new_zeros(dets_th.shape[0], dtype=torch.long),
+            iou_thr, kernel=method, sigma=sigma, min_score=min_score)
+        new_dets = dets_th[inds].clone()
+        new_dets[:, 4] = scores
+        if is_tensor:
+            return new_dets, inds
+        return new_dets.numpy().astype(np.float32), inds.numpy()
     new_dets, inds = soft_nms_cpu(
         dets_np,
         iou_thr,
@@ -10,9 +10,8 @@ import numpy as np
 import torch
 import torch.nn.functional as F
 
-import platform
-if platform.system() != 'Windows':
-    from detector.nms import nms_wrapper
+from detector.apis import unletterbox_boxes
+from detector.nms import nms_wrapper
 
 # Set printoptions
 torch.set_printoptions(linewidth=1320, precision=5, profile='long')
@@ -99,17 +98,9 @@ def xywh2xyxy(x):
 
 
 def scale_coords(img_size, coords, img0_shape):
-    # Rescale x1, y1, x2, y2 from 416 to image size
+    # Rescale x1, y1, x2, y2 from the letterboxed img_size (w,h) to the image size (w,h), clipped to the image
     coords = coords.cpu().clone()
-    gain_w = float(img_size[0]) / img0_shape[0]  # gain  = old / new
-    gain_h = float(img_size[1]) / img0_shape[1]
-    gain = min(gain_w, gain_h)
-    pad_x = (img_size[0] - img0_shape[0] * gain) / 2  # width padding
-    pad_y = (img_size[1] - img0_shape[1] * gain) / 2  # height padding
-    coords[:, [0, 2]] -= pad_x
-    coords[:, [1, 3]] -= pad_y
-    coords[:, 0:4] /= gain
-    coords[:, :4] = torch.clamp(coords[:, :4], min=0)
+    unletterbox_boxes(coords[:, :4], img_size, torch.as_tensor(img0_shape[:2]))
     return coords
 
 
@@ -420,22 +411,36 @@ def pooling_nms(heatmap, kernel=1):
     keep = (hmax == heatmap).float()
     return keep * heatmap
 
-def soft_nms(dets, sigma=0.5, Nt=0.3, threshold=0.05, method=1):
-    keep = cpu_soft_nms(np.ascontiguousarray(dets, dtype=np.float32),
-            np.float32(sigma), np.float32(Nt),
-            np.float32(threshold),
-            np.uint8(method))
-    return keep
-
-def non_max_suppression(prediction, conf_thres=0.5, nms_thres=0.4, method=-1):
+def non_max_suppression(prediction, conf_thres=0.5, nms_thres=0.4, method='nms', kernel='gaussian', sigma=0.5):
     """
     Removes detections with lower object confidence score than 'conf_thres'
     Non-Maximum Suppression to further filter detections.
+    With the soft_nms and matrix_nms methods, the object confidence is decayed
+    instead, for all the images at once, and boxes decayed below 'conf_thres' are dropped.
     Returns detections with shape:
         (x1, y1, x2, y2, object_conf, class_score, class_pred)
     """
 
     output = [None for _ in range(len(prediction))]
+    if method in nms_wrapper.SOFT_NMS_METHODS:
+        batch_inds, box_inds = torch.nonzero(prediction[:, :, 4] > conf_thres, as_tuple=True)
+        if batch_inds.shape[0] == 0:
+            return output
+        pred = prediction[batch_inds, box_inds]
+        # From (center x, center y, width, height) to (x1, y1, x2, y2)
+        pred[:, :4] = xywh2xyxy(pred[:, :4])
+        soft_nms_op = nms_wrapper.SOFT_NMS_METHODS[method]
+        scores, keep = soft_nms_op(pred[:, :5], batch_inds, nms_thres,
+                                   kernel=kernel, sigma=sigma, min_score=conf_thres)
+        pred = pred[keep]
+        pred[:, 4] = scores
+        batch_inds = batch_inds[keep]
+        for image_i in torch.unique(batch_inds).tolist():
+            output[image_i] = pred[batch_inds == image_i]
+        return output
+    elif method != 'nms':
+        raise ValueError('Unknown NMS method: {}'.format(method))
+
     for image_i, pred in enumerate(prediction):
         # Filter out confidence scores below threshold
         # Get score and class with highest confidence
@@ -454,19 +459,12 @@ def non_max_suppression(prediction, conf_thres=0.5, nms_thres=0.4, method=-1):
         # From (center x, center y, width, height) to (x1, y1, x2, y2)
         pred[:, :4] = xywh2xyxy(pred[:, :4])
 
-        
         # Non-maximum suppression
-        if method == -1 and platform.system() != 'Windows':
-            #We use faster rcnn implementation of nms (soft nms is optional)
-            nms_op = getattr(nms_wrapper, 'nms')
-            #nms_op input:(n,(x1,y1,x2,y2,c))
-            #nms_op output: input[inds,:], inds
-            _, nms_indices = nms_op(pred[:,:5], nms_thres)
-            
-        else:
-            dets = pred[:, :5].clone().contiguous().data.cpu().numpy()
-            nms_indices = soft_nms(dets, Nt=nms_thres, method=method)
-        det_max = pred[nms_indices]        
+        #We use faster rcnn implementation of nms, see SOFT_NMS_METHODS for the soft ones
+        #nms_op input:(n,(x1,y1,x2,y2,c))
+        #nms_op output: input[inds,:], inds
+        _, nms_indices = nms_wrapper.nms(pred[:,:5], nms_thres)
+        det_max = pred[nms_indices]
 
         if len(det_max) > 0:
             # Add max detections to outputs
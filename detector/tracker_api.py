@@ -35,6 +35,9 @@ class Tracker(BaseDetector):
         self.model_weights = cfg.get('WEIGHTS', 'detector/tracker/data/jde.1088x608.uncertainty.pt')
         self.img_size = cfg.get('IMG_SIZE', (1088, 608))
         self.nms_thres = cfg.get('NMS_THRES', 0.6)
+        self.nms_method = cfg.get('NMS_METHOD', 'nms')
+        self.nms_kernel = cfg.get('NMS_KERNEL', 'gaussian')
+        self.nms_sigma = cfg.get('NMS_SIGMA', 0.5)
         self.confidence = cfg.get('CONFIDENCE', 0.05)
         self.max_time_lost = cfg.get('BUFFER_SIZE', 30) # buffer
         self.model = None
@@ -68,11 +71,12 @@ class Tracker(BaseDetector):
 
         
 
-    def image_preprocess(self, img_source):
+    def image_preprocess(self, img_source, return_orig=False, inp_size=None):
         """
-        Pre-process the img before fed to the object detection network
+        Pre-process the img before fed to the object detection network, at the fixed IMG_SIZE
         Input: image name(str) or raw image data(ndarray or torch.Tensor,channel GBR)
         Output: pre-processed image data(torch.FloatTensor,(1,3,h,w))
+                and, if return_orig, the decoded original image(ndarray,channel BGR)
         """
         if isinstance(img_source, str):
             img, orig_img, im_dim_list = prep_image(img_source, self.img_size)
@@ -81,6 +85,8 @@ class Tracker(BaseDetector):
         else:
             raise IOError('Unknown image source type: {}'.format(type(img_source)))
 
+        if return_orig:
+            return img, orig_img
         return img
 
     def images_detection(self, imgs, orig_dim_list):
@@ -111,7 +117,8 @@ class Tracker(BaseDetector):
             pred = self.model(imgs)
 
         if len(pred) > 0:
-            dets = non_max_suppression(pred, self.confidence, self.nms_thres)
+            dets = non_max_suppression(pred, self.confidence, self.nms_thres, method=self.nms_method,
+                                       kernel=self.nms_kernel, sigma=self.nms_sigma)
 
         output_stracks = []
         for image_i in range(len(imgs)):
@@ -234,5 +241,32 @@ class Tracker(BaseDetector):
             
         return torch.stack(output_stracks)
 
+    def images_propagation(self, dets, orig_dim_list):
+        """
+        Propagate the tracks with the Kalman filter over frames skipped by the detector,
+        instead of reusing the last detections
+        Input: dets: detections of the last detected frame, unused
+               orig_dim_list(torch.FloatTensor, (b,(w,h,w,h))): original size of the skipped frames
+        Output: dets(torch.FloatTensor,(n,(batch_idx,x1,y1,x2,y2,c,s))): predicted tracks
+        """
+        output_stracks = []
+        for image_i in range(len(orig_dim_list)):
+            self.frame_id += 1
+            # Predict the current location with KF, as for a frame without detection
+            tracked_stracks = [t for t in self.tracked_stracks if t.is_activated]
+            for strack in joint_stracks(tracked_stracks, self.lost_stracks):
+                strack.predict()
+
+            for t in self.tracked_stracks:
+                tlwh = t.tlwh
+                tlbr = t.tlbr
+                if tlwh[2] * tlwh[3] > self.tracker_opt.min_box_area:
+                    output_stracks.append(torch.tensor([image_i, tlbr[0], tlbr[1], tlbr[2], tlbr[3], t.score, t.track_id]))
+
+        if len(output_stracks) == 0:
+            return 0
+
+        return torch.stack(output_stracks)
+
     def detect_one_img(self, img_name):
         pass
\ No newline at end of file
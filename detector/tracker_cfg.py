@@ -5,5 +5,8 @@ cfg.CONFIG = 'detector/tracker/cfg/yolov3.cfg'
 cfg.WEIGHTS = 'detector/tracker/data/jde.1088x608.uncertainty.pt'
 cfg.IMG_SIZE =  (1088, 608)
 cfg.NMS_THRES =  0.6
+cfg.NMS_METHOD = 'nms' # option: nms/soft_nms/matrix_nms, the last two decay the scores of overlapping boxes
+cfg.NMS_KERNEL = 'gaussian' # score decay of soft_nms and matrix_nms, option: linear/gaussian
+cfg.NMS_SIGMA = 0.5 # sigma of the gaussian kernel
 cfg.CONFIDENCE = 0.4
 cfg.BUFFER_SIZE = 30 # frame buffer
\ No newline at end of file
@@ -10,11 +10,11 @@ import matplotlib.pyplot as plt
 try:
     from util import count_parameters as count
     from util import convert2cpu as cpu
-    from util import predict_transform
+    from util import predict_transform, yolo_grid, decode_predictions
 except ImportError:
     from yolo.util import count_parameters as count
     from yolo.util import convert2cpu as cpu
-    from yolo.util import predict_transform
+    from yolo.util import predict_transform, yolo_grid, decode_predictions
 
 class test_net(nn.Module):
     def __init__(self, num_layers, input_size):
@@ -307,6 +307,10 @@ class Darknet(nn.Module):
         self.net_info, self.module_list = create_modules(self.blocks)
         self.header = torch.IntTensor([0,0,0,0])
         self.seen = 0
+        # grid offsets, anchors and strides of the yolo layers, keyed by (inp_dim, grid sizes, device, dtype)
+        self.grid_cache = {}
+        # layers whose output is read again by a later layer, and the outputs freed after each layer
+        self.kept_outputs, self.freed_outputs = self.output_liveness()
 
         
         
@@ -317,89 +321,105 @@ class Darknet(nn.Module):
         return self.module_list
 
                 
+    def layer_inputs(self, i):
+        """Indices of the earlier layers whose outputs are read by layer i"""
+        block = self.blocks[i + 1]
+        module_type = block["type"]
+        if module_type == "route":
+            layers = [int(a) for a in block["layers"]]
+            # positive indices are absolute, negative ones relative
+            return [i + (l - i if l > 0 else l) for l in layers]
+        elif module_type == "shortcut":
+            return [i - 1, i + int(block["from"])]
+        elif module_type == "yolo":
+            # the output of a yolo layer is the one of the previous layer
+            return [i - 1]
+        return []
+
+    def output_liveness(self):
+        """
+        Find once which layer outputs are read again, and after which layer they are read
+        for the last time, so that `forward` keeps only those and frees them right away.
+        """
+        last_use = {}
+        for i in range(len(self.blocks) - 1):
+            for j in self.layer_inputs(i):
+                last_use[j] = i
+        freed = {}
+        for j, i in last_use.items():
+            freed.setdefault(i, []).append(j)
+        return set(last_use), freed
+
+    def get_grid(self, inp_dim, heads, device, dtype):
+        """
+        Grid offsets, anchors and strides of all the yolo layers, concatenated in the
+        order of their predictions. They only depend on the input size, so they are
+        built once and cached.
+        """
+        grid_sizes = tuple((x.size(2), x.size(3)) for x, _, _ in heads)
+        key = (inp_dim, grid_sizes, device, dtype)
+        if key not in self.grid_cache:
+            offsets, anchors, strides = [], [], []
+            for grid_size, (_, head_anchors, _) in zip(grid_sizes, heads):
+                stride = inp_dim // grid_size[0]
+                x_y_offset, anchors_i = yolo_grid(grid_size, head_anchors, stride)
+                offsets.append(x_y_offset)
+                anchors.append(anchors_i)
+                strides.append(torch.full((1, x_y_offset.size(1), 1), stride))
+            self.grid_cache[key] = tuple(torch.cat(t, 1).to(device=device, dtype=dtype)
+                                         for t in (offsets, anchors, strides))
+        return self.grid_cache[key]
+
     def forward(self, x, args):
-        detections = []
+        #Get the input height, from the input itself since its size can change per batch
+        inp_dim = x.size(2)
         modules = self.blocks[1:]
         outputs = {}   #We cache the outputs for the route layer
-        
-        
-        write = 0
+        heads = []  # raw outputs of the yolo layers, decoded together at the end
+
         for i in range(len(modules)):        
             
             module_type = (modules[i]["type"])
             if module_type == "convolutional" or module_type == "upsample" or module_type == "maxpool":
                 
                 x = self.module_list[i](x)
-                outputs[i] = x
 
-                
             elif module_type == "route":
-                layers = modules[i]["layers"]
-                layers = [int(a) for a in layers]
-                
-                if (layers[0]) > 0:
-                    layers[0] = layers[0] - i
-
-                if len(layers) == 1:
-                    x = outputs[i + (layers[0])]
-
-                elif len(layers) == 2:
-                    if (layers[1]) > 0:
-                        layers[1] = layers[1] - i
-                        
-                    map1 = outputs[i + layers[0]]
-                    map2 = outputs[i + layers[1]]
-
-                    x = torch.cat((map1, map2), 1)
-                elif len(layers) == 4:  # SPP
-                    map1 = outputs[i + layers[0]]
-                    map2 = outputs[i + layers[1]]
-                    map3 = outputs[i + layers[2]]
-                    map4 = outputs[i + layers[3]]
-
-                    x = torch.cat((map1, map2, map3, map4), 1)
-                outputs[i] = x
-            
+                maps = [outputs[j] for j in self.layer_inputs(i)]
+                x = maps[0] if len(maps) == 1 else torch.cat(maps, 1)
+
             elif  module_type == "shortcut":
-                from_ = int(modules[i]["from"])
-                x = outputs[i-1] + outputs[i+from_]
-                outputs[i] = x
-                
-            
-            
+                prev, from_ = self.layer_inputs(i)
+                x = outputs[prev] + outputs[from_]
+
             elif module_type == 'yolo':        
                 
                 anchors = self.module_list[i][0].anchors
-                #Get the input dimensions
-                inp_dim = int (self.net_info["height"])
-                
                 #Get the number of classes
                 num_classes = int (modules[i]["classes"])
                 
-                #Output the result
-                x = x.data.to(args.device)
-                x = predict_transform(x, inp_dim, anchors, num_classes, args)
-                
-                if type(x) == int:
-                    continue
+                heads.append((x.data.to(args.device), anchors, num_classes))
 
-                
-                if not write:
-                    detections = x
-                    write = 1
-                
-                else:
-                    detections = torch.cat((detections, x), 1)
-                
-                outputs[i] = outputs[i-1]
-                
-        
-        
-        try:
-            return detections
-        except:
+            # only keep the outputs read by later layers, and free them after their last use
+            if i in self.kept_outputs:
+                outputs[i] = x
+            for j in self.freed_outputs.get(i, []):
+                del outputs[j]
+
+        if len(heads) == 0:
             return 0
 
+        # reshape every head to (batch, boxes, attrs) and decode all the boxes in one pass
+        predictions = []
+        for head, anchors, num_classes in heads:
+            batch_size, _, grid_h, grid_w = head.shape
+            bbox_attrs = 5 + num_classes
+            head = head.view(batch_size, bbox_attrs * len(anchors), grid_h * grid_w).transpose(1, 2)
+            predictions.append(head.reshape(batch_size, grid_h * grid_w * len(anchors), bbox_attrs))
+        prediction = torch.cat(predictions, 1)
+        x_y_offset, anchors, strides = self.get_grid(inp_dim, heads, prediction.device, prediction.dtype)
+        return decode_predictions(prediction, x_y_offset, anchors, strides)
+
             
     def load_weights(self, weightfile):
         
@@ -15,23 +15,80 @@ except ImportError:
     from yolo.util import convert2cpu as cpu
 from PIL import Image, ImageDraw
 
+INTERPOLATIONS = {
+    'nearest': cv2.INTER_NEAREST,
+    'linear': cv2.INTER_LINEAR,
+    'cubic': cv2.INTER_CUBIC,
+    'area': cv2.INTER_AREA
+}
 
-def letterbox_image(img, inp_dim):
+
+def letterbox_image(img, inp_dim, interpolation=cv2.INTER_CUBIC):
     '''resize image with unchanged aspect ratio using padding'''
     img_w, img_h = img.shape[1], img.shape[0]
     w, h = inp_dim
     new_w = int(img_w * min(w / img_w, h / img_h))
     new_h = int(img_h * min(w / img_w, h / img_h))
-    resized_image = cv2.resize(img, (new_w, new_h), interpolation=cv2.INTER_CUBIC)
+    resized_image = cv2.resize(img, (new_w, new_h), interpolation=interpolation)
 
-    canvas = np.full((inp_dim[1], inp_dim[0], 3), 128)
+    canvas = np.full((inp_dim[1], inp_dim[0], 3), 128, dtype=np.uint8)
 
     canvas[(h - new_h) // 2:(h - new_h) // 2 + new_h, (w - new_w) // 2:(w - new_w) // 2 + new_w, :] = resized_image
 
     return canvas
 
 
-def prep_image(img, inp_dim):
+class LetterboxBatch(object):
+    """
+    Letterbox a batch of images into one preallocated uint8 tensor (b,3,h,w).
+
+    Each image is resized and written in place, already in RGB channel-first
+    layout, so no per-image canvas or copy is needed. The whole batch is then
+    converted to float and normalized in a single pass.
+    The buffer is not pinned: the batch is normalized on the cpu, usually in a
+    pre-processing worker which should not create a cuda context.
+    """
+
+    def __init__(self, inp_dim, batch_size, interpolation=cv2.INTER_CUBIC):
+        if isinstance(inp_dim, int):
+            inp_dim = (inp_dim, inp_dim)
+        self.inp_dim = inp_dim
+        self.batch_size = batch_size
+        self.interpolation = interpolation
+
+        w, h = inp_dim
+        self.buffer = torch.empty((batch_size, 3, h, w), dtype=torch.uint8)
+        self._buffer_np = self.buffer.numpy()
+
+    def fill(self, idx, img):
+        """Letterbox image `img`(ndarray,(h,w,3),channel BGR) into slot `idx` of the batch"""
+        img_w, img_h = img.shape[1], img.shape[0]
+        w, h = self.inp_dim
+        new_w = int(img_w * min(w / img_w, h / img_h))
+        new_h = int(img_h * min(w / img_w, h / img_h))
+        top, left = (h - new_h) // 2, (w - new_w) // 2
+        resized_image = cv2.resize(img, (new_w, new_h), interpolation=self.interpolation)
+
+        slot = self._buffer_np[idx]
+        if new_h != h or new_w != w:
+            slot.fill(128)
+        # BGR (h,w,3) -> RGB (3,h,w) while writing into the slot
+        np.copyto(slot[:, top:top + new_h, left:left + new_w], resized_image.transpose((2, 0, 1))[::-1])
+
+    def normalize(self, batch_size=None, device=None):
+        """
+        Convert the first `batch_size` slots to a new torch.FloatTensor in [0, 1].
+        If `device` is given, the uint8 batch is moved first and normalized there.
+        """
+        if batch_size is None:
+            batch_size = self.batch_size
+        imgs = self.buffer[:batch_size]
+        if device is not None:
+            imgs = imgs.to(device)
+        return imgs.float().div_(255.0)
+
+
+def prep_image(img, inp_dim, interpolation=cv2.INTER_CUBIC):
     """
     Prepare image for inputting to the neural network.
 
@@ -40,13 +97,15 @@ def prep_image(img, inp_dim):
 
     orig_im = cv2.imread(img)
     dim = orig_im.shape[1], orig_im.shape[0]
-    img = (letterbox_image(orig_im, (inp_dim, inp_dim)))
+    if isinstance(inp_dim, int):
+        inp_dim = (inp_dim, inp_dim)
+    img = (letterbox_image(orig_im, inp_dim, interpolation))
     img_ = img[:, :, ::-1].transpose((2, 0, 1)).copy()
     img_ = torch.from_numpy(img_).float().div(255.0).unsqueeze(0)
     return img_, orig_im, dim
 
 
-def prep_frame(img, inp_dim):
+def prep_frame(img, inp_dim, interpolation=cv2.INTER_CUBIC):
     """
     Prepare image for inputting to the neural network.
 
@@ -55,7 +114,9 @@ def prep_frame(img, inp_dim):
 
     orig_im = img
     dim = orig_im.shape[1], orig_im.shape[0]
-    img = (letterbox_image(orig_im, (inp_dim, inp_dim)))
+    if isinstance(inp_dim, int):
+        inp_dim = (inp_dim, inp_dim)
+    img = (letterbox_image(orig_im, inp_dim, interpolation))
     img_ = img[:, :, ::-1].transpose((2, 0, 1)).copy()
     img_ = torch.from_numpy(img_).float().div(255.0).unsqueeze(0)
     return img_, orig_im, dim
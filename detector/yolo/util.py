@@ -26,16 +26,36 @@ def convert2cpu(matrix):
     else:
         return matrix
 
+def yolo_grid(grid_size, anchors, stride):
+    """
+    Cell offsets and anchors (in grid units) of a yolo layer, for every
+    predicted box in the order of `predict_transform`
+    Input: grid_size(int or (grid_h, grid_w)): the grid is rectangular for rectangular inputs
+    Output: x_y_offset(torch.FloatTensor,(1,grid_h*grid_w*num_anchors,2)),
+            anchors(torch.FloatTensor,(1,grid_h*grid_w*num_anchors,2))
+    """
+    if isinstance(grid_size, int):
+        grid_size = (grid_size, grid_size)
+    grid_h, grid_w = grid_size
+    num_anchors = len(anchors)
+    anchors = [(a[0]/stride, a[1]/stride) for a in anchors]
+
+    a,b = np.meshgrid(np.arange(grid_w), np.arange(grid_h))
+
+    x_offset = torch.FloatTensor(a).view(-1,1)
+    y_offset = torch.FloatTensor(b).view(-1,1)
+
+    x_y_offset = torch.cat((x_offset, y_offset), 1).repeat(1,num_anchors).view(-1,2).unsqueeze(0)
+    anchors = torch.FloatTensor(anchors).repeat(grid_h*grid_w, 1).unsqueeze(0)
+    return x_y_offset, anchors
+
+
 def predict_transform(prediction, inp_dim, anchors, num_classes, args):
     batch_size = prediction.size(0)
     stride =  inp_dim // prediction.size(2)
     grid_size = inp_dim // stride
     bbox_attrs = 5 + num_classes
     num_anchors = len(anchors)
-    
-    anchors = [(a[0]/stride, a[1]/stride) for a in anchors]
-
-
 
     prediction = prediction.view(batch_size, bbox_attrs*num_anchors, grid_size*grid_size)
     prediction = prediction.transpose(1,2).contiguous()
@@ -46,36 +66,19 @@ def predict_transform(prediction, inp_dim, anchors, num_classes, args):
     prediction[:,:,0] = torch.sigmoid(prediction[:,:,0])
     prediction[:,:,1] = torch.sigmoid(prediction[:,:,1])
     prediction[:,:,4] = torch.sigmoid(prediction[:,:,4])
-    
 
-    
-    #Add the center offsets
-    grid_len = np.arange(grid_size)
-    a,b = np.meshgrid(grid_len, grid_len)
-    
-    x_offset = torch.FloatTensor(a).view(-1,1)
-    y_offset = torch.FloatTensor(b).view(-1,1)
-    
-    if args:
-        x_offset = x_offset.to(args.device)
-        y_offset = y_offset.to(args.device)
-    else:
-        x_offset = x_offset.cuda()
-        y_offset = y_offset.cuda()
-    
-    x_y_offset = torch.cat((x_offset, y_offset), 1).repeat(1,num_anchors).view(-1,2).unsqueeze(0)
-    
-    prediction[:,:,:2] += x_y_offset
-      
-    #log space transform height and the width
-    anchors = torch.FloatTensor(anchors)
-    
+    x_y_offset, anchors = yolo_grid(grid_size, anchors, stride)
     if args:
+        x_y_offset = x_y_offset.to(args.device)
         anchors = anchors.to(args.device)
     else:
+        x_y_offset = x_y_offset.cuda()
         anchors = anchors.cuda()
-    
-    anchors = anchors.repeat(grid_size*grid_size, 1).unsqueeze(0)
+
+    #Add the center offsets
+    prediction[:,:,:2] += x_y_offset
+
+    #log space transform height and the width
     prediction[:,:,2:4] = torch.exp(prediction[:,:,2:4])*anchors
 
     #Softmax the class scores
@@ -86,6 +89,20 @@ def predict_transform(prediction, inp_dim, anchors, num_classes, args):
     
     return prediction
 
+
+def decode_predictions(prediction, x_y_offset, anchors, strides):
+    """
+    Decode the raw predictions of all the yolo layers at once, same as `predict_transform`
+    Input: prediction(torch.Tensor,(b,n,5+num_classes)): raw predictions of the layers, concatenated
+           x_y_offset, anchors(torch.Tensor,(1,n,2)): grid of the layers, see `yolo_grid`
+           strides(torch.Tensor,(1,n,1)): stride of the layer of each box
+    Output: prediction(torch.Tensor,(b,n,5+num_classes)): boxes (center x, center y, w, h) in input image pixels
+    """
+    output = torch.sigmoid(prediction)
+    output[:,:,:2] = (output[:,:,:2] + x_y_offset) * strides
+    output[:,:,2:4] = torch.exp(prediction[:,:,2:4]) * anchors * strides
+    return output
+
 def load_classes(namesfile):
     fp = open(namesfile, "r")
     names = fp.read().split("\n")[:-1]
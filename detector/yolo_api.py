@@ -4,27 +4,25 @@
 # -----------------------------------------------------
 
 """API of yolo detector"""
+import math
 import os
 import sys
 sys.path.insert(0, os.path.dirname(__file__))
 from abc import ABC, abstractmethod
-import platform
+import threading
 
+import cv2
 import torch
+import torch.nn.functional as F
 import numpy as np
 
-from yolo.preprocess import prep_image, prep_frame
+from yolo.preprocess import prep_image, prep_frame, LetterboxBatch, INTERPOLATIONS
 from yolo.darknet import Darknet
-from yolo.util import unique
-from yolo.bbox import bbox_iou
 
-from detector.apis import BaseDetector
-
-#only windows visual studio 2013 ~2017 support compile c/cuda extensions
-#If you force to compile extension on Windows and ensure appropriate visual studio
-#is intalled, you can try to use these ext_modules.
-if platform.system() != 'Windows':
-    from detector.nms import nms_wrapper
+from detector.apis import BaseDetector, image_tiles, unletterbox_boxes
+#nms falls back to a pure pytorch implementation if the c/cuda extensions are not compiled,
+#e.g. on Windows, see nms_wrapper.set_nms_backend
+from detector.nms import nms_wrapper
 
 
 class YOLODetector(BaseDetector):
@@ -37,9 +35,30 @@ class YOLODetector(BaseDetector):
         self.model_weights = cfg.get('WEIGHTS', 'detector/yolo/data/yolov3-spp.weights')
         self.inp_dim = cfg.get('INP_DIM', 608)
         self.nms_thres = cfg.get('NMS_THRES', 0.6)
+        self.nms_method = cfg.get('NMS_METHOD', 'nms')
+        self.nms_kernel = cfg.get('NMS_KERNEL', 'gaussian')
+        self.nms_sigma = cfg.get('NMS_SIGMA', 0.5)
+        if self.nms_method != 'nms' and self.nms_method not in nms_wrapper.SOFT_NMS_METHODS:
+            raise ValueError('Unknown NMS_METHOD: {}'.format(self.nms_method))
         self.confidence = cfg.get('CONFIDENCE', 0.05)
         self.num_classes = cfg.get('NUM_CLASSES', 80)
+        self.interpolation = INTERPOLATIONS[cfg.get('INTERPOLATION', 'cubic')]
+        # adaptive input size, images are letterboxed to INP_DIM and downscaled per batch
+        self.inp_dims = sorted(d for d in cfg.get('INP_DIMS', []) if d <= self.inp_dim)
+        self.min_person_height = cfg.get('MIN_PERSON_HEIGHT', 64)
+        self.min_person_conf = cfg.get('MIN_PERSON_CONF', 0.5)
+        self.inp_dim_refresh = cfg.get('INP_DIM_REFRESH', 30)
+        self._next_inp_dim = self.inp_dim
+        self._reduced_batches = 0
+        # tiled detection of high resolution images
+        self.tile_dim = cfg.get('TILE_DIM', 0)
+        self.tile_overlap = cfg.get('TILE_OVERLAP', 0.2)
+        if self.tile_dim > 0:
+            # the tiles and the whole images would pick the input size of each other
+            self.inp_dims = []
         self.model = None
+        # batched letterbox buffers, allocated lazily per thread that does pre-processing
+        self.letterbox = {}
 
     def load_model(self):
         args = self.detector_opt
@@ -59,21 +78,65 @@ class YOLODetector(BaseDetector):
             self.model.cuda()
         self.model.eval()
 
-    def image_preprocess(self, img_source):
+    def input_size(self, img_w, img_h):
+        """
+        Smallest rectangular input, with sides multiple of 32, holding the image letterboxed
+        at the scale of an INP_DIM x INP_DIM input, so that no stride of gray padding is computed
+        """
+        scale = self.inp_dim / max(img_w, img_h)
+        return (int(math.ceil(img_w * scale / 32)) * 32, int(math.ceil(img_h * scale / 32)) * 32)
+
+    def image_preprocess(self, img_source, return_orig=False, inp_size=None):
         """
         Pre-process the img before fed to the object detection network
         Input: image name(str) or raw image data(ndarray or torch.Tensor,channel GBR)
+               inp_size((w,h)): size of the letterbox, INP_DIM x INP_DIM by default
         Output: pre-processed image data(torch.FloatTensor,(1,3,h,w))
+                and, if return_orig, the decoded original image(ndarray,channel BGR)
         """
+        inp_size = inp_size or self.inp_dim
         if isinstance(img_source, str):
-            img, orig_img, im_dim_list = prep_image(img_source, self.inp_dim)
+            img, orig_img, im_dim_list = prep_image(img_source, inp_size, self.interpolation)
         elif isinstance(img_source, torch.Tensor) or isinstance(img_source, np.ndarray):
-            img, orig_img, im_dim_list = prep_frame(img_source, self.inp_dim)
+            img, orig_img, im_dim_list = prep_frame(img_source, inp_size, self.interpolation)
         else:
             raise IOError('Unknown image source type: {}'.format(type(img_source)))
 
+        if return_orig:
+            return img, orig_img
         return img
 
+    def images_preprocess(self, img_sources, inp_size=None):
+        """
+        Pre-process a mini-batch of images with one preallocated letterbox buffer
+        Input: list of image names(str) or raw image data(ndarray or torch.Tensor,channel BGR)
+               inp_size((w,h)): size of the letterbox, INP_DIM x INP_DIM by default
+        Output: pre-processed images(torch.FloatTensor,(b,3,h,w)),
+                list of decoded original images(ndarray,channel BGR)
+        """
+        inp_size = tuple(inp_size or (self.inp_dim, self.inp_dim))
+        # one buffer per thread and input size
+        key = (threading.get_ident(), inp_size)
+        letterbox = self.letterbox.get(key)
+        if letterbox is None or letterbox.batch_size < len(img_sources):
+            letterbox = LetterboxBatch(inp_size, len(img_sources), self.interpolation)
+            self.letterbox[key] = letterbox
+
+        orig_imgs = []
+        for i, img_source in enumerate(img_sources):
+            if isinstance(img_source, str):
+                orig_img = cv2.imread(img_source)
+            elif isinstance(img_source, torch.Tensor):
+                orig_img = img_source.numpy()
+            elif isinstance(img_source, np.ndarray):
+                orig_img = img_source
+            else:
+                raise IOError('Unknown image source type: {}'.format(type(img_source)))
+            letterbox.fill(i, orig_img)
+            orig_imgs.append(orig_img)
+
+        return letterbox.normalize(len(img_sources)), orig_imgs
+
     def images_detection(self, imgs, orig_dim_list):
         """
         Feed the img data into object detection network and 
@@ -91,150 +154,201 @@ class YOLODetector(BaseDetector):
             self.load_model()
         with torch.no_grad():
             imgs = imgs.to(args.device) if args else imgs.cuda()
+            # the input is letterboxed at the scale of INP_DIM, possibly to a rectangle
+            inp_h, inp_w = imgs.shape[2:]
+            inp_dim = self.select_inp_dim()
+            if inp_dim < max(inp_h, inp_w):
+                scale = inp_dim / max(inp_h, inp_w)
+                imgs = F.interpolate(imgs, mode='area', size=(int(math.ceil(inp_h * scale / 32)) * 32,
+                                                              int(math.ceil(inp_w * scale / 32)) * 32))
             prediction = self.model(imgs, args=args) 
             #do nms to the detection results, only human category is left
             dets = self.dynamic_write_results(prediction, self.confidence, 
                                               self.num_classes, nms=True, 
                                               nms_conf=self.nms_thres)
             if isinstance(dets, int) or dets.shape[0] == 0:
+                self.update_inp_dim(None, None)
                 return 0
             dets = dets.cpu()
 
             orig_dim_list = torch.index_select(orig_dim_list, 0, dets[:, 0].long())
-            scaling_factor = torch.min(self.inp_dim / orig_dim_list, 1)[0].view(-1, 1)
-            dets[:, [1, 3]] -= (self.inp_dim - scaling_factor * orig_dim_list[:, 0].view(-1, 1)) / 2
-            dets[:, [2, 4]] -= (self.inp_dim - scaling_factor * orig_dim_list[:, 1].view(-1, 1)) / 2
-            dets[:, 1:5] /= scaling_factor
-            for i in range(dets.shape[0]):
-                dets[i, [1, 3]] = torch.clamp(dets[i, [1, 3]], 0.0, orig_dim_list[i, 0])
-                dets[i, [2, 4]] = torch.clamp(dets[i, [2, 4]], 0.0, orig_dim_list[i, 1])
+            if tuple(imgs.shape[2:]) != (inp_h, inp_w):
+                # back to the letterbox, the sides of the downscaled input are rounded separately
+                dets[:, [1, 3]] *= inp_w / imgs.shape[3]
+                dets[:, [2, 4]] *= inp_h / imgs.shape[2]
+            unletterbox_boxes(dets[:, 1:5], (inp_w, inp_h), orig_dim_list)
+            self.update_inp_dim(dets, orig_dim_list)
 
             return dets
 
+    def tiled(self):
+        return self.tile_dim > 0
+
+    def tiles_detection(self, imgs, orig_imgs, orig_dim_list, batch_size=None):
+        """
+        Detect people in the whole images and in overlapping tiles of TILE_DIM pixels of the images
+        larger than that, so that small people are not shrunk below the detection limit by the letterbox.
+        The tiles of all the images share the network batches, of `batch_size` tiles, b by default.
+        Boxes cut by a tile border inside the image are dropped: people narrower than the overlap
+        are whole in a neighbouring tile, and wider ones are found in the whole image.
+        The remaining boxes of the tiles and of the whole images are merged by NMS.
+        Input: imgs(torch.FloatTensor,(b,3,h,w)): pre-processed mini-batch image input
+               orig_imgs: list of the original images(ndarray,channel BGR, as given to `images_preprocess`,
+                         not the RGB views of the pipeline)
+               orig_dim_list(torch.FloatTensor, (b,(w,h,w,h))): original mini-batch image size
+        Output: dets(torch.FloatTensor,(n,(batch_idx,x1,y1,x2,y2,c,s,idx of cls))) or 0 if none
+        """
+        batch_size = batch_size or len(imgs)
+        outputs = []
+        dets = self.images_detection(imgs, orig_dim_list)
+        if not isinstance(dets, int):
+            outputs.append(dets)
+
+        # (image index, x0, y0, x1, y1) of the tiles of all the images
+        tiles = []
+        for k, orig_img in enumerate(orig_imgs):
+            img_tiles = image_tiles(orig_img.shape[1], orig_img.shape[0], self.tile_dim, self.tile_overlap)
+            if len(img_tiles) > 1:
+                tiles.extend((k,) + tile for tile in img_tiles)
+        for start in range(0, len(tiles), batch_size):
+            batch = tiles[start:start + batch_size]
+            tile_imgs, _ = self.images_preprocess([orig_imgs[k][y0:y1, x0:x1] for k, x0, y0, x1, y1 in batch])
+            batch = torch.tensor(batch, dtype=torch.float)
+            tile_dims = batch[:, 3:5] - batch[:, 1:3]
+            dets = self.images_detection(tile_imgs, tile_dims.repeat(1, 2))
+            if isinstance(dets, int):
+                continue
+            tile = batch[dets[:, 0].long()]
+            img_dims = orig_dim_list[tile[:, 0].long(), :2]
+            dets[:, 1:5] += tile[:, 1:3].repeat(1, 2)
+            dets[:, 0] = tile[:, 0]
+            cut = ((dets[:, 1:3] <= tile[:, 1:3] + 1) & (tile[:, 1:3] > 0)) | \
+                  ((dets[:, 3:5] >= tile[:, 3:5] - 1) & (tile[:, 3:5] < img_dims))
+            outputs.append(dets[~cut.any(1)])
+
+        if len(outputs) == 0:
+            return 0
+        # the scores were already decayed within each tile by the soft methods
+        return self.batched_nms(torch.cat(outputs), self.nms_thres, method='nms')
+
+    def select_inp_dim(self):
+        """Input size of the next batch, INP_DIM unless a smaller one of INP_DIMS was picked by `update_inp_dim`"""
+        if self._next_inp_dim == self.inp_dim or self._reduced_batches >= self.inp_dim_refresh:
+            self._reduced_batches = 0
+            return self.inp_dim
+        self._reduced_batches += 1
+        return self._next_inp_dim
+
+    def update_inp_dim(self, dets, orig_dim_list):
+        """
+        Pick the input size of the next batch from the detections of this one: the smallest size
+        of INP_DIMS at which the smallest person of confidence MIN_PERSON_CONF is MIN_PERSON_HEIGHT pixels high,
+        INP_DIM if there is none, e.g. when nobody is detected.
+        Input: dets(torch.FloatTensor,(n,(batch_idx,x1,y1,x2,y2,c,...))) in original image coordinates, or None
+               orig_dim_list(torch.FloatTensor,(n,(w,h,w,h))): original size of the image of each box
+        """
+        if not self.inp_dims:
+            return
+        self._next_inp_dim = self.inp_dim
+        if dets is None:
+            return
+        # low confidence boxes are often tiny false positives
+        confident = dets[:, 5] >= self.min_person_conf
+        if not confident.any():
+            return
+        # person heights for an input of size 1, the longer side of the images is letterboxed to the input size
+        heights = (dets[confident, 4] - dets[confident, 2]) / orig_dim_list[confident, :2].max(1)[0]
+        min_dim = self.min_person_height / max(float(heights.min()), 1e-6)
+        self._next_inp_dim = next((d for d in self.inp_dims if d >= min_dim), self.inp_dim)
+
     def dynamic_write_results(self, prediction, confidence, num_classes, nms=True, nms_conf=0.4):
-        prediction_bak = prediction.clone()
-        dets = self.write_results(prediction.clone(), confidence, num_classes, nms, nms_conf)
-        if isinstance(dets, int):
-            return dets
+        candidates = self.person_candidates(prediction, confidence, num_classes)
+        if isinstance(candidates, int) or not nms:
+            return candidates
 
+        dets = self.batched_nms(candidates, nms_conf)
         if dets.shape[0] > 100:
-            nms_conf -= 0.05
-            dets = self.write_results(prediction_bak.clone(), confidence, num_classes, nms, nms_conf)
+            # too many detections, suppress more boxes, starting again from the same candidates
+            dets = self.batched_nms(candidates, nms_conf - 0.05)
 
         return dets
 
     def write_results(self, prediction, confidence, num_classes, nms=True, nms_conf=0.4):
-        args = self.detector_opt
         #prediction: (batchsize, num of objects, (xc,yc,w,h,box confidence, 80 class scores))
-        conf_mask = (prediction[:, :, 4] > confidence).float().float().unsqueeze(2)
-        prediction = prediction * conf_mask
-
-        try:
-            ind_nz = torch.nonzero(prediction[:,:,4]).transpose(0,1).contiguous()
-        except:
-            return 0
-
-        #the 3rd channel of prediction: (xc,yc,w,h)->(x1,y1,x2,y2)
-        box_a = prediction.new(prediction.shape)
-        box_a[:,:,0] = (prediction[:,:,0] - prediction[:,:,2]/2)
-        box_a[:,:,1] = (prediction[:,:,1] - prediction[:,:,3]/2)
-        box_a[:,:,2] = (prediction[:,:,0] + prediction[:,:,2]/2) 
-        box_a[:,:,3] = (prediction[:,:,1] + prediction[:,:,3]/2)
-        prediction[:,:,:4] = box_a[:,:,:4]
-
-        batch_size = prediction.size(0)
-
-        output = prediction.new(1, prediction.size(2) + 1)
-        write = False
-        num = 0
-        for ind in range(batch_size):
-            #select the image from the batch
-            image_pred = prediction[ind]
-
-            #Get the class having maximum score, and the index of that class
-            #Get rid of num_classes softmax scores 
-            #Add the class index and the class score of class having maximum score
-            max_conf, max_conf_score = torch.max(image_pred[:,5:5+ num_classes], 1)
-            max_conf = max_conf.float().unsqueeze(1)
-            max_conf_score = max_conf_score.float().unsqueeze(1)
-            seq = (image_pred[:,:5], max_conf, max_conf_score)
-            #image_pred:(n,(x1,y1,x2,y2,c,s,idx of cls))
-            image_pred = torch.cat(seq, 1)
-
-            #Get rid of the zero entries
-            non_zero_ind =  (torch.nonzero(image_pred[:,4]))
-
-            image_pred_ = image_pred[non_zero_ind.squeeze(),:].view(-1,7)
-
-            #Get the various classes detected in the image
-            try:
-                img_classes = unique(image_pred_[:,-1])
-            except:
-                continue
+        candidates = self.person_candidates(prediction, confidence, num_classes)
+        if isinstance(candidates, int) or not nms:
+            return candidates
+        #output:(n,(batch_ind,x1,y1,x2,y2,c,s,idx of cls))
+        return self.batched_nms(candidates, nms_conf)
 
-            #WE will do NMS classwise
-            #print(img_classes)
-            for cls in img_classes:
-                if cls != 0:
-                    continue
-                #get the detections with one particular class
-                cls_mask = image_pred_*(image_pred_[:,-1] == cls).float().unsqueeze(1)
-                class_mask_ind = torch.nonzero(cls_mask[:,-2]).squeeze()
-
-                image_pred_class = image_pred_[class_mask_ind].view(-1,7)
-
-                #sort the detections such that the entry with the maximum objectness
-                #confidence is at the top
-                conf_sort_index = torch.sort(image_pred_class[:,4], descending = True )[1]
-                image_pred_class = image_pred_class[conf_sort_index]
-                idx = image_pred_class.size(0)
-
-                #if nms has to be done
-                if nms:
-                    if platform.system() != 'Windows':
-                        #We use faster rcnn implementation of nms (soft nms is optional)
-                        nms_op = getattr(nms_wrapper, 'nms')
-                        #nms_op input:(n,(x1,y1,x2,y2,c))
-                        #nms_op output: input[inds,:], inds
-                        _, inds = nms_op(image_pred_class[:,:5], nms_conf)
-
-                        image_pred_class = image_pred_class[inds]
-                    else:
-                        # Perform non-maximum suppression
-                        max_detections = []
-                        while image_pred_class.size(0):
-                            # Get detection with highest confidence and save as max detection
-                            max_detections.append(image_pred_class[0].unsqueeze(0))
-                            # Stop if we're at the last detection
-                            if len(image_pred_class) == 1:
-                                break
-                            # Get the IOUs for all boxes with lower confidence
-                            ious = bbox_iou(max_detections[-1], image_pred_class[1:], args)
-                            # Remove detections with IoU >= NMS threshold
-                            image_pred_class = image_pred_class[1:][ious < nms_conf]
-
-                        image_pred_class = torch.cat(max_detections).data
-
-                #Concatenate the batch_id of the image to the detection
-                #this helps us identify which image does the detection correspond to 
-                #We use a linear straucture to hold ALL the detections from the batch
-                #the batch_dim is flattened
-                #batch is identified by extra batch column
-
-                batch_ind = image_pred_class.new(image_pred_class.size(0), 1).fill_(ind)
-                seq = batch_ind, image_pred_class
-                if not write:
-                    output = torch.cat(seq,1)
-                    write = True
-                else:
-                    out = torch.cat(seq,1)
-                    output = torch.cat((output,out))
-                num += 1
-    
-        if not num:
+    def person_candidates(self, prediction, confidence, num_classes):
+        """
+        Select the boxes of the whole batch whose confidence is over the threshold and
+        whose most likely class is person (class 0)
+        Input: prediction(torch.Tensor,(b,n,(xc,yc,w,h,c,class scores)))
+        Output: candidates(torch.Tensor,(m,(batch_ind,x1,y1,x2,y2,c,s,idx of cls))), or 0 if none
+        """
+        max_conf, max_conf_idx = torch.max(prediction[:, :, 5:5 + num_classes], 2)
+        mask = (prediction[:, :, 4] > confidence) & (max_conf_idx == 0)
+        ind_nz = torch.nonzero(mask)
+        if ind_nz.shape[0] == 0:
             return 0
-        #output:(n,(batch_ind,x1,y1,x2,y2,c,s,idx of cls))
-        return output
+        batch_ind, box_ind = ind_nz[:, 0], ind_nz[:, 1]
+        image_pred = prediction[batch_ind, box_ind]
+
+        #(xc,yc,w,h)->(x1,y1,x2,y2)
+        half_wh = image_pred[:, 2:4] / 2
+        seq = (batch_ind.to(image_pred.dtype).unsqueeze(1),
+               image_pred[:, :2] - half_wh, image_pred[:, :2] + half_wh,
+               image_pred[:, 4:5], max_conf[batch_ind, box_ind].unsqueeze(1),
+               max_conf_idx[batch_ind, box_ind].to(image_pred.dtype).unsqueeze(1))
+        return torch.cat(seq, 1)
+
+    def batched_nms(self, candidates, nms_conf, method=None):
+        """
+        NMS of the candidates of all the images at once. The boxes of each image are shifted
+        by an offset larger than all the boxes, so that boxes of different images never overlap.
+        With the soft_nms and matrix_nms methods, the confidence c of the kept boxes is decayed
+        by their overlaps with better boxes, and boxes decayed below the confidence threshold are dropped.
+        `method` overrides NMS_METHOD.
+        Output: dets(torch.Tensor,(n,(batch_ind,x1,y1,x2,y2,c,s,idx of cls))), sorted by image
+                and by decreasing confidence within each image
+        """
+        method = method or self.nms_method
+        if method in nms_wrapper.SOFT_NMS_METHODS:
+            soft_nms_op = nms_wrapper.SOFT_NMS_METHODS[method]
+            scores, keep = soft_nms_op(candidates[:, 1:6], candidates[:, 0].long(), nms_conf,
+                                       kernel=self.nms_kernel, sigma=self.nms_sigma,
+                                       min_score=self.confidence)
+            dets = candidates[keep]
+            dets[:, 5] = scores
+        else:
+            boxes = candidates[:, 1:5]
+            offsets = candidates[:, 0:1] * (boxes.max() - boxes.min() + 1)
+            #nms input:(n,(x1,y1,x2,y2,c))
+            keep = self.nms(torch.cat((boxes + offsets, candidates[:, 5:6]), 1), nms_conf)
+            dets = candidates[keep]
+        # group the detections by image, each image sorted by decreasing confidence
+        order = torch.sort(dets[:, 0] * 2 - dets[:, 5])[1]
+        return dets[order]
+
+    def nms(self, dets, nms_conf):
+        """Indices of the boxes kept by NMS, dets:(n,(x1,y1,x2,y2,c))"""
+        #nms_op output: input[inds,:], inds
+        _, inds = nms_wrapper.nms(dets, nms_conf)
+        return inds
+
+    def cache_config(self):
+        if self.inp_dims:
+            # the input size depends on the previous batches
+            return None
+        # retrained weights saved under the same name must not hit the cache
+        weights_mtime = os.path.getmtime(self.model_weights) if os.path.exists(self.model_weights) else None
+        return {'detector': 'yolo', 'config': self.model_cfg, 'weights': self.model_weights,
+                'weights_mtime': weights_mtime, 'inp_dim': self.inp_dim, 'interpolation': self.interpolation,
+                'confidence': self.confidence, 'num_classes': self.num_classes, 'nms_thres': self.nms_thres,
+                'nms_method': self.nms_method, 'nms_kernel': self.nms_kernel, 'nms_sigma': self.nms_sigma,
+                'tile_dim': self.tile_dim, 'tile_overlap': self.tile_overlap}
 
     def detect_one_img(self, img_name):
         """
@@ -268,25 +382,16 @@ class YOLODetector(BaseDetector):
                 return None
             dets = dets.cpu()
 
-            img_dim_list = torch.index_select(img_dim_list, 0, dets[:, 0].long())
-            scaling_factor = torch.min(self.inp_dim / img_dim_list, 1)[0].view(-1, 1)
-            dets[:, [1, 3]] -= (self.inp_dim - scaling_factor * img_dim_list[:, 0].view(-1, 1)) / 2
-            dets[:, [2, 4]] -= (self.inp_dim - scaling_factor * img_dim_list[:, 1].view(-1, 1)) / 2
-            dets[:, 1:5] /= scaling_factor
-            for i in range(dets.shape[0]):
-                dets[i, [1, 3]] = torch.clamp(dets[i, [1, 3]], 0.0, img_dim_list[i, 0])
-                dets[i, [2, 4]] = torch.clamp(dets[i, [2, 4]], 0.0, img_dim_list[i, 1])
+            unletterbox_boxes(dets[:, 1:5], self.inp_dim, img_dim_list)
 
+            image_id = int(os.path.basename(img_name).split('.')[0])
+            for _, x1, y1, x2, y2, score in dets[:, :6].tolist():
                 #write results
                 det_dict = {}
-                x = float(dets[i, 1])
-                y = float(dets[i, 2])
-                w = float(dets[i, 3] - dets[i, 1])
-                h = float(dets[i, 4] - dets[i, 2])
                 det_dict["category_id"] = 1
-                det_dict["score"] = float(dets[i, 5])
-                det_dict["bbox"] = [x, y, w, h]
-                det_dict["image_id"] = int(os.path.basename(img_name).split('.')[0])
+                det_dict["score"] = score
+                det_dict["bbox"] = [x1, y1, x2 - x1, y2 - y1]
+                det_dict["image_id"] = image_id
                 dets_results.append(det_dict)
 
             return dets_results
@@ -4,6 +4,16 @@ cfg = edict()
 cfg.CONFIG = 'detector/yolo/cfg/yolov3-spp.cfg'
 cfg.WEIGHTS = 'detector/yolo/data/yolov3-spp.weights'
 cfg.INP_DIM =  608
+cfg.INP_DIMS = [] # adaptive input size, e.g. [320, 416, 512, 608]: each batch runs at the smallest size keeping the people of the previous batch MIN_PERSON_HEIGHT pixels high, empty to always use INP_DIM
+cfg.MIN_PERSON_HEIGHT = 64 # height in pixels of the smallest person at the network input, for INP_DIMS
+cfg.MIN_PERSON_CONF = 0.5 # with INP_DIMS, confidence of the boxes counted as people, low confidence boxes are often tiny false positives
+cfg.INP_DIM_REFRESH = 30 # with INP_DIMS, run one batch at INP_DIM after this many smaller ones, to find new small people
+cfg.TILE_DIM = 0 # detect images larger than this many pixels on overlapping tiles of this size as well, for small people in 4K frames, e.g. 1280, 0 to disable
+cfg.TILE_OVERLAP = 0.2 # minimum overlap of neighbouring tiles, as a fraction of TILE_DIM
 cfg.NMS_THRES =  0.6
+cfg.NMS_METHOD = 'nms' # option: nms/soft_nms/matrix_nms, the last two decay the scores of overlapping boxes
+cfg.NMS_KERNEL = 'gaussian' # score decay of soft_nms and matrix_nms, option: linear/gaussian
+cfg.NMS_SIGMA = 0.5 # sigma of the gaussian kernel
 cfg.CONFIDENCE = 0.05
-cfg.NUM_CLASSES = 80
\ No newline at end of file
+cfg.NUM_CLASSES = 80
+cfg.INTERPOLATION = 'cubic' # resize method of letterbox, option: nearest/linear/cubic/area
\ No newline at end of file
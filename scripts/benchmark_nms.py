@@ -0,0 +1,53 @@
+"""Micro-benchmark of the available NMS backends."""
+import argparse
+import time
+
+import torch
+
+from detector.nms.nms_wrapper import NMS_BACKENDS, get_nms_backend
+
+parser = argparse.ArgumentParser(description='NMS backends benchmark')
+parser.add_argument('--num_boxes', type=str, default='100,1000,5000',
+                    help='comma separated numbers of boxes to benchmark')
+parser.add_argument('--thresh', type=float, default=0.6,
+                    help='IoU threshold')
+parser.add_argument('--repeat', type=int, default=10,
+                    help='number of runs of each benchmark')
+parser.add_argument('--device', type=str, default='cpu',
+                    help='device of the boxes, e.g. cpu or cuda:0')
+args = parser.parse_args()
+
+
+def random_dets(num_boxes, device, img_size=608):
+    """Random boxes of persons in a letterboxed image, with scores"""
+    xy = torch.rand(num_boxes, 2) * img_size
+    wh = torch.rand(num_boxes, 2) * img_size / 4 + 8
+    scores = torch.rand(num_boxes, 1)
+    return torch.cat((xy, xy + wh, scores), 1).to(device)
+
+
+def timeit(func, dets):
+    func(dets, args.thresh)
+    if dets.is_cuda:
+        torch.cuda.synchronize()
+    start = time.time()
+    for _ in range(args.repeat):
+        inds = func(dets, args.thresh)
+    if dets.is_cuda:
+        torch.cuda.synchronize()
+    return (time.time() - start) / args.repeat, inds
+
+
+if __name__ == "__main__":
+    print('Available backends: {}, default: {}'.format(list(NMS_BACKENDS), get_nms_backend()))
+    for num_boxes in [int(n) for n in args.num_boxes.split(',')]:
+        torch.manual_seed(0)
+        dets = random_dets(num_boxes, args.device)
+        reference = None
+        for name, func in NMS_BACKENDS.items():
+            t, inds = timeit(func, dets)
+            kept = set(inds.cpu().tolist())
+            if reference is None:
+                reference = kept
+            print('{:>6} boxes | {:<12} | {:8.3f} ms | kept {:5d} | same as {}: {}'.format(
+                num_boxes, name, t * 1000, len(kept), list(NMS_BACKENDS)[0], kept == reference))
@@ -10,7 +10,7 @@ import torch
 from tqdm import tqdm
 
 from detector.apis import get_detector
-from alphapose.models import builder
+from alphapose.models.engine import POSE_BACKENDS, build_pose_engine
 from alphapose.utils.config import update_config
 from alphapose.utils.detector import DetectionLoader
 from alphapose.utils.pPose_nms import write_json
@@ -50,6 +50,8 @@ parser.add_argument('--detbatch', type=int, default=5,
                     help='detection batch size PER GPU')
 parser.add_argument('--posebatch', type=int, default=80,
                     help='pose estimation maximum batch size PER GPU')
+parser.add_argument('--pose_backend', type=str, default='eager', choices=POSE_BACKENDS,
+                    help='runtime of the pose model, torchscript and onnx take a model exported by scripts/export_pose.py as checkpoint')
 parser.add_argument('--eval', dest='eval', default=False, action='store_true',
                     help='save the result json as coco format, using image index(int) instead of image name(str)')
 parser.add_argument('--gpus', type=str, dest='gpus', default="0",
@@ -116,16 +118,8 @@ if __name__ == "__main__":
     detector = get_detector(args)
 
     # Load pose model
-    pose_model = builder.build_sppe(cfg.MODEL, preset_cfg=cfg.DATA_PRESET)
-
     print(f'Loading pose model from {args.checkpoint}...')
-    pose_model.load_state_dict(torch.load(args.checkpoint, map_location=args.device))
-
-    if len(args.gpus) > 1:
-        pose_model = torch.nn.DataParallel(pose_model, device_ids=args.gpus).to(args.device)
-    else:
-        pose_model.to(args.device)
-    pose_model.eval()
+    pose_model = build_pose_engine(cfg, args.checkpoint, backend=args.pose_backend, device=args.device, gpus=args.gpus)
 
     for pkg_id in os.listdir(input_root):
         pkg_root = os.path.join(input_root, pkg_id)
@@ -4,17 +4,20 @@ import os
 import platform
 import sys
 import time
+from queue import Empty
 
 import numpy as np
 import torch
 from tqdm import tqdm
 
 from detector.apis import get_detector
-from alphapose.models import builder
+from alphapose.models.engine import POSE_BACKENDS, build_pose_engine
 from alphapose.utils.config import update_config
 from alphapose.utils.detector import DetectionLoader
+from alphapose.utils.file_walker import DirectoryWalker, ListFile, split_patterns
+from alphapose.utils.pose_batcher import PoseBatcher
 from alphapose.utils.pPose_nms import write_json
-from alphapose.utils.transforms import flip, flip_heatmap
+from alphapose.utils.transforms import flip, flip_heatmap, normalize_crops
 from alphapose.utils.vis import getTime
 from alphapose.utils.webcam_detector import WebCamDetectionLoader
 from alphapose.utils.writer import DataWriter
@@ -35,6 +38,12 @@ parser.add_argument('--indir', dest='inputpath',
                     help='image-directory', default="")
 parser.add_argument('--list', dest='inputlist',
                     help='image-list', default="")
+parser.add_argument('--archive', dest='inputarchive',
+                    help='comma separated tar/zip archives (or glob patterns) of images, read sequentially', default="")
+parser.add_argument('--include', type=str, default="",
+                    help='comma separated glob patterns of the images to process in --indir or --archive, e.g. *.jpg,*.png')
+parser.add_argument('--exclude', type=str, default="",
+                    help='comma separated glob patterns of the images to skip in --indir or --archive')
 parser.add_argument('--image', dest='inputimg',
                     help='image-name', default="")
 parser.add_argument('--outdir', dest='outputpath',
@@ -53,16 +62,46 @@ parser.add_argument('--detbatch', type=int, default=5,
                     help='detection batch size PER GPU')
 parser.add_argument('--posebatch', type=int, default=80,
                     help='pose estimation maximum batch size PER GPU')
+parser.add_argument('--pose_backend', type=str, default='eager', choices=POSE_BACKENDS,
+                    help='runtime of the pose model, torchscript and onnx take a model exported by scripts/export_pose.py as checkpoint')
 parser.add_argument('--eval', dest='eval', default=False, action='store_true',
                     help='save the result json as coco format, using image index(int) instead of image name(str)')
 parser.add_argument('--gpus', type=str, dest='gpus', default="0",
                     help='choose which cuda device to use by index and input comma to use multi gpus, e.g. 0,1,2,3. (input -1 for cpu only)')
 parser.add_argument('--qsize', type=int, dest='qsize', default=1024,
                     help='the length of result buffer, where reducing it will lower requirement of cpu memory')
+parser.add_argument('--gate_thresh', type=float, default=0,
+                    help='skip the detector on frames whose downsampled difference with the last detected frame '
+                         'is under this mean gray level difference (0-255), 0 to disable')
+parser.add_argument('--gate_max_reuse', type=int, default=10,
+                    help='maximum number of frames in a row on which the detector is skipped')
+parser.add_argument('--det_cache', type=str, default='',
+                    help='directory of an on-disk cache of the detections, reused by later runs on the same images')
+parser.add_argument('--det_cache_size', type=int, default=1024,
+                    help='maximum size of the detection cache in MB, the least recently used detections are dropped')
+parser.add_argument('--bucket_window', type=int, default=0,
+                    help='letterbox images to rectangular detector inputs fitting their aspect ratio, and batch images '
+                         'of the same input size within this many images, 0 for square inputs')
+parser.add_argument('--crop_mode', type=str, default='affine', choices=['affine', 'roi_align'],
+                    help='crop the detected people by batched affine warps or by RoIAlign')
+parser.add_argument('--uint8_crops', default=False, action='store_true',
+                    help='pass the crops of the people to the pose stage as uint8, normalized on the pose device')
+parser.add_argument('--pose_frames', type=int, default=1,
+                    help='batch the crops of up to this many consecutive frames for the pose model, 1 for one frame per batch')
+parser.add_argument('--pose_delay', type=float, default=100,
+                    help='with --pose_frames, maximum time in ms a frame waits for the next ones, 0 for no deadline')
+parser.add_argument('--memory_budget', type=float, dest='memory_budget', default=0,
+                    help='keep the frames buffered in the pipeline under this memory budget in MB (0 for unlimited)')
+parser.add_argument('--shm_frames', type=int, dest='shm_frames', default=0,
+                    help='pass original images between processes through a shared memory buffer of this many frames (0 to disable)')
 parser.add_argument('--flip', default=False, action='store_true',
                     help='enable flip testing')
 parser.add_argument('--debug', default=False, action='store_true',
                     help='print detail information')
+parser.add_argument('--decode_workers', type=int, default=1,
+                    help='number of workers decoding and letterboxing input images')
+parser.add_argument('--decode_backend', type=str, default='thread', choices=['thread', 'process'],
+                    help='run the decode workers as threads or processes')
 """----------------------------- Video options -----------------------------"""
 parser.add_argument('--video', dest='video',
                     help='video-name', default="")
@@ -74,6 +113,16 @@ parser.add_argument('--vis_fast', dest='vis_fast',
                     help='use fast rendering', action='store_true', default=False)
 parser.add_argument('--pose_track', dest='pose_track',
                     help='track humans in video', action='store_true', default=False)
+parser.add_argument('--frame_stride', dest='frame_stride', type=int, default=1,
+                    help='only process every N-th frame of the video')
+parser.add_argument('--sample_fps', dest='sample_fps', type=float, default=0,
+                    help='sample the video at this frame rate, overrides --frame_stride (0 to disable)')
+parser.add_argument('--decode_buffer', dest='decode_buffer', type=int, default=16,
+                    help='number of video frames decoded ahead of the detector')
+parser.add_argument('--video_workers', dest='video_workers', type=int, default=1,
+                    help='number of workers decoding segments of the video in parallel')
+parser.add_argument('--video_segment', dest='video_segment', type=int, default=256,
+                    help='number of frames of the video segments decoded by each worker')
 
 args = parser.parse_args()
 cfg = update_config(args.cfg)
@@ -106,6 +155,10 @@ def check_input():
         else:
             raise IOError('Error: --video must refer to a video file, not directory.')
 
+    # for archives of images
+    if len(args.inputarchive):
+        return 'archive', args.inputarchive
+
     # for images
     if len(args.inputpath) or len(args.inputlist) or len(args.inputimg):
         inputpath = args.inputpath
@@ -113,10 +166,12 @@ def check_input():
         inputimg = args.inputimg
 
         if len(inputlist):
-            im_names = open(inputlist, 'r').readlines()
+            # stream the names, the list may be too large to be read at once
+            im_names = ListFile(inputlist)
         elif len(inputpath) and inputpath != '/':
-            for root, dirs, files in os.walk(inputpath):
-                im_names = files
+            # walk the directory and its sub-directories lazily
+            im_names = DirectoryWalker(inputpath, include=split_patterns(args.include),
+                                       exclude=split_patterns(args.exclude))
         elif len(inputimg):
             im_names = [inputimg]
 
@@ -128,11 +183,33 @@ def check_input():
 
 def print_finish_info():
     print('===========================> Finish Model Running.')
+    if args.profile and monitor is not None:
+        print('===========================> Queue stats:')
+        for line in monitor.summary():
+            print(line)
     if (args.save_img or args.save_video) and not args.vis_fast:
         print('===========================> Rendering remaining images in the queue...')
         print('===========================> If this step takes too long, you can enable the --vis_fast flag to use fast rendering (real-time).')
 
 
+def output_name(im_name, mode):
+    """
+    Name of the results of an image: its path relative to the input directory or in the archive,
+    so that images of different sub-directories do not overwrite each other, else its file name
+    """
+    if mode == 'image' and len(args.inputpath):
+        name = os.path.relpath(im_name, args.inputpath)
+    elif mode == 'archive':
+        name = im_name
+    else:
+        name = os.path.basename(im_name)
+    name = os.path.normpath(name)
+    if name.startswith('..') or os.path.isabs(name):
+        # e.g. a list entry outside of the input directory
+        name = os.path.basename(im_name)
+    return name.replace(os.sep, '/')
+
+
 def loop():
     n = 0
     while True:
@@ -153,16 +230,8 @@ if __name__ == "__main__":
         det_loader = DetectionLoader(input_source, get_detector(args), cfg, args, batchSize=args.detbatch, mode=mode).start()
 
     # Load pose model
-    pose_model = builder.build_sppe(cfg.MODEL, preset_cfg=cfg.DATA_PRESET)
-
     print(f'Loading pose model from {args.checkpoint}...')
-    pose_model.load_state_dict(torch.load(args.checkpoint, map_location=args.device))
-
-    if len(args.gpus) > 1:
-        pose_model = torch.nn.DataParallel(pose_model, device_ids=args.gpus).to(args.device)
-    else:
-        pose_model.to(args.device)
-    pose_model.eval()
+    pose_model = build_pose_engine(cfg, args.checkpoint, backend=args.pose_backend, device=args.device, gpus=args.gpus)
 
     runtime_profile = {
         'dt': [],
@@ -172,16 +241,20 @@ if __name__ == "__main__":
 
     # Init data writer
     queueSize = 2 if mode == 'webcam' else args.qsize
-    if args.save_video and mode != 'image':
+    frame_buffer = det_loader.frame_buffer
+    monitor = det_loader.monitor
+    if args.save_video and det_loader.videoinfo is not None:
         from alphapose.utils.writer import DEFAULT_VIDEO_SAVE_OPT as video_save_opt
         if mode == 'video':
             video_save_opt['savepath'] = os.path.join(args.outputpath, 'AlphaPose_' + os.path.basename(input_source))
         else:
             video_save_opt['savepath'] = os.path.join(args.outputpath, 'AlphaPose_webcam' + str(input_source) + '.mp4')
         video_save_opt.update(det_loader.videoinfo)
-        writer = DataWriter(cfg, args, save_video=True, video_save_opt=video_save_opt, queueSize=queueSize).start()
+        writer = DataWriter(cfg, args, save_video=True, video_save_opt=video_save_opt, queueSize=queueSize,
+                            frame_buffer=frame_buffer, monitor=monitor).start()
     else:
-        writer = DataWriter(cfg, args, save_video=False, queueSize=queueSize).start()
+        writer = DataWriter(cfg, args, save_video=False, queueSize=queueSize,
+                            frame_buffer=frame_buffer, monitor=monitor).start()
 
     if mode == 'webcam':
         print('Starting webcam demo, press Ctrl + C to terminate...')
@@ -189,47 +262,80 @@ if __name__ == "__main__":
         im_names_desc = tqdm(loop())
     else:
         data_len = det_loader.length
-        im_names_desc = tqdm(range(data_len), dynamic_ncols=True)
+        if data_len is None:
+            # streamed input of unknown length, read until the end of input sentinel
+            im_names_desc = tqdm(loop(), dynamic_ncols=True)
+        else:
+            im_names_desc = tqdm(range(data_len), dynamic_ncols=True)
 
     batchSize = args.posebatch
     if args.flip:
         batchSize = int(batchSize / 2)
+
+    def pose_forward(inps):
+        datalen = inps.size(0)
+        leftover = 0
+        if (datalen) % batchSize:
+            leftover = 1
+        num_batches = datalen // batchSize + leftover
+        hm = []
+        for j in range(num_batches):
+            inps_j = inps[j * batchSize:min((j + 1) * batchSize, datalen)]
+            if args.flip:
+                inps_j = torch.cat((inps_j, flip(inps_j)))
+            hm_j = pose_model(inps_j)
+            if args.flip:
+                hm_j_flip = flip_heatmap(hm_j[int(len(hm_j) / 2):], det_loader.joint_pairs, shift=True)
+                hm_j = (hm_j[0:int(len(hm_j) / 2)] + hm_j_flip) / 2
+            hm.append(hm_j)
+        return torch.cat(hm)
+
+    def save(frame, hm):
+        (boxes, scores, ids, cropped_boxes, orig_img, im_name) = frame
+        if hm is None:
+            writer.save(None, None, None, None, None, orig_img, output_name(im_name, mode))
+        else:
+            writer.save(boxes, scores, ids, hm.cpu(), cropped_boxes, orig_img, output_name(im_name, mode))
+
+    def read():
+        # the pending frames are estimated if the next frame is late
+        timeout = pose_batcher.timeout()
+        if timeout is not None:
+            try:
+                return det_loader.read(timeout=timeout)
+            except Empty:
+                for frame, hm in pose_batcher.flush():
+                    save(frame, hm)
+        return det_loader.read()
+
+    # the crops of consecutive frames are batched together, the frames are saved in order
+    pose_batcher = PoseBatcher(pose_forward, batchSize, max_frames=args.pose_frames, max_delay=args.pose_delay / 1000.)
     try:
         for i in im_names_desc:
             start_time = getTime()
             with torch.no_grad():
-                (inps, orig_img, im_name, boxes, scores, ids, cropped_boxes) = det_loader.read()
+                (inps, orig_img, im_name, boxes, scores, ids, cropped_boxes) = read()
                 if orig_img is None:
                     break
+                # the pending frames keep their shared memory slots and memory budget until they are saved
+                max_held = det_loader.max_held_frames()
+                if max_held is not None:
+                    pose_batcher.max_frames = max(1, min(args.pose_frames, max_held + 1))
                 if boxes is None or boxes.nelement() == 0:
-                    writer.save(None, None, None, None, None, orig_img, os.path.basename(im_name))
-                    continue
+                    inps = None
+                else:
+                    # uint8 crops are normalized on the device
+                    inps = normalize_crops(inps.to(args.device))
                 if args.profile:
                     ckpt_time, det_time = getTime(start_time)
                     runtime_profile['dt'].append(det_time)
                 # Pose Estimation
-                inps = inps.to(args.device)
-                datalen = inps.size(0)
-                leftover = 0
-                if (datalen) % batchSize:
-                    leftover = 1
-                num_batches = datalen // batchSize + leftover
-                hm = []
-                for j in range(num_batches):
-                    inps_j = inps[j * batchSize:min((j + 1) * batchSize, datalen)]
-                    if args.flip:
-                        inps_j = torch.cat((inps_j, flip(inps_j)))
-                    hm_j = pose_model(inps_j)
-                    if args.flip:
-                        hm_j_flip = flip_heatmap(hm_j[int(len(hm_j) / 2):], det_loader.joint_pairs, shift=True)
-                        hm_j = (hm_j[0:int(len(hm_j) / 2)] + hm_j_flip) / 2
-                    hm.append(hm_j)
-                hm = torch.cat(hm)
+                done = pose_batcher.add(inps, (boxes, scores, ids, cropped_boxes, orig_img, im_name))
                 if args.profile:
                     ckpt_time, pose_time = getTime(ckpt_time)
                     runtime_profile['pt'].append(pose_time)
-                hm = hm.cpu()
-                writer.save(boxes, scores, ids, hm, cropped_boxes, orig_img, os.path.basename(im_name))
+                for frame, hm in done:
+                    save(frame, hm)
 
                 if args.profile:
                     ckpt_time, post_time = getTime(ckpt_time)
@@ -241,6 +347,9 @@ if __name__ == "__main__":
                     'det time: {dt:.4f} | pose time: {pt:.4f} | post processing: {pn:.4f}'.format(
                         dt=np.mean(runtime_profile['dt']), pt=np.mean(runtime_profile['pt']), pn=np.mean(runtime_profile['pn']))
                 )
+        with torch.no_grad():
+            for frame, hm in pose_batcher.flush():
+                save(frame, hm)
         print_finish_info()
         while(writer.running()):
             time.sleep(1)
@@ -0,0 +1,56 @@
+"""Export a pose model to TorchScript and ONNX for the pose engines."""
+import argparse
+import os
+
+import torch
+
+from alphapose.models import builder
+from alphapose.models.engine import (build_pose_engine, check_pose_engine,
+                                     export_onnx, export_torchscript)
+from alphapose.utils.config import update_config
+
+parser = argparse.ArgumentParser(description='AlphaPose Pose Model Export')
+parser.add_argument('--cfg', type=str, required=True,
+                    help='experiment configure file name')
+parser.add_argument('--checkpoint', type=str, required=True,
+                    help='checkpoint file name')
+parser.add_argument('--format', type=str, default='all', choices=['torchscript', 'onnx', 'all'],
+                    help='exported format')
+parser.add_argument('--outdir', type=str, default='exp/export',
+                    help='output directory of the exported models')
+parser.add_argument('--opset', type=int, default=11,
+                    help='ONNX opset version')
+parser.add_argument('--atol', type=float, default=1e-3,
+                    help='maximum difference of the heatmaps of the exported models with the eager model')
+parser.add_argument('--no_check', default=False, action='store_true',
+                    help='do not compare the heatmaps of the exported models with the eager model, '
+                         'e.g. when onnxruntime is not installed')
+args = parser.parse_args()
+cfg = update_config(args.cfg)
+
+
+if __name__ == "__main__":
+    # the export runs on cpu, the exported models are loaded on any device by the engines
+    model = builder.build_sppe(cfg.MODEL, preset_cfg=cfg.DATA_PRESET)
+    print(f'Loading pose model from {args.checkpoint}...')
+    model.load_state_dict(torch.load(args.checkpoint, map_location='cpu'))
+    model.eval()
+
+    if not os.path.exists(args.outdir):
+        os.makedirs(args.outdir)
+    name = os.path.splitext(os.path.basename(args.checkpoint))[0]
+
+    formats = ['torchscript', 'onnx'] if args.format == 'all' else [args.format]
+    for fmt in formats:
+        if fmt == 'torchscript':
+            path = export_torchscript(model, cfg, os.path.join(args.outdir, name + '.pt'))
+        else:
+            path = export_onnx(model, cfg, os.path.join(args.outdir, name + '.onnx'), opset_version=args.opset)
+        print(f'Exported {cfg.MODEL.TYPE} to {path}')
+        if args.no_check:
+            print(f'The heatmaps of {path} were not checked against the eager model')
+            continue
+        # fails if the runtime of the format is not installed, e.g. onnxruntime, see --no_check
+        engine = build_pose_engine(cfg, path, backend=fmt)
+        diff = check_pose_engine(model, engine, cfg, atol=args.atol)
+        print(f'Heatmaps of {path} match the eager model, max difference {diff:.2e}')
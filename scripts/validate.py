@@ -7,6 +7,7 @@ import torch
 from tqdm import tqdm
 
 from alphapose.models import builder
+from alphapose.models.engine import POSE_BACKENDS, build_pose_engine
 from alphapose.utils.config import update_config
 from alphapose.utils.metrics import evaluate_mAP
 from alphapose.utils.transforms import (flip, flip_heatmap,
@@ -32,6 +33,11 @@ parser.add_argument('--flip-test',
                     dest='flip_test',
                     help='flip test',
                     action='store_true')
+parser.add_argument('--pose_backend',
+                    default='eager',
+                    choices=POSE_BACKENDS,
+                    help='runtime of the model, torchscript and onnx take a model exported by scripts/export_pose.py as checkpoint',
+                    type=str)
 parser.add_argument('--detector', dest='detector',
                     help='detector name', default="yolo")
 
@@ -142,12 +148,8 @@ def validate_gt(m, cfg, heatmap_to_coord, batch_size=20):
 
 
 if __name__ == "__main__":
-    m = builder.build_sppe(cfg.MODEL, preset_cfg=cfg.DATA_PRESET)
-
     print(f'Loading model from {opt.checkpoint}...')
-    m.load_state_dict(torch.load(opt.checkpoint))
-
-    m = torch.nn.DataParallel(m, device_ids=gpus).cuda()
+    m = build_pose_engine(cfg, opt.checkpoint, backend=opt.pose_backend, device=torch.device('cuda'), gpus=gpus)
     heatmap_to_coord = get_func_heatmap_to_coord(cfg)
 
     with torch.no_grad():
@@ -0,0 +1,84 @@
+"""Parity of the exported pose engines with the eager pose models."""
+import os
+
+import pytest
+import torch
+
+from alphapose.models import builder
+from alphapose.models.engine import (EagerEngine, PoseEngine, build_pose_engine,
+                                     export_onnx, export_torchscript)
+from alphapose.utils.config import update_config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CONFIGS = {
+    'FastPose': 'configs/coco/resnet/256x192_res50_lr1e-3_1x.yaml',
+    'FastPose_DUC': 'configs/coco/resnet/256x192_res50_lr1e-3_1x-duc.yaml',
+    'SimplePose': 'configs/coco/resnet/256x192_res50_lr1e-3_1x-simple.yaml',
+    'PoseHighResolutionNet': 'configs/coco/hrnet/256x192_w32_lr1e-3.yaml',
+}
+# small crops, a multiple of the stride 32 of the backbones
+IMAGE_SIZE = [128, 96]
+# the models are exported with a batch of 2, the batch is dynamic
+BATCH_SIZE = 3
+ATOL = 1e-4
+
+
+def build_model(name, monkeypatch):
+    """Pose model of type `name` with random weights, in eval mode"""
+    cfg = update_config(os.path.join(ROOT, CONFIGS[name]))
+    assert cfg.MODEL.TYPE == name
+    cfg.DATA_PRESET.IMAGE_SIZE = IMAGE_SIZE
+    if name != 'PoseHighResolutionNet':
+        tm = pytest.importorskip('torchvision.models')
+        # random backbone weights instead of downloading the ImageNet ones
+        monkeypatch.setattr(tm, 'resnet{}'.format(cfg.MODEL.NUM_LAYERS), lambda pretrained=False: torch.nn.Module())
+    torch.manual_seed(0)
+    model = builder.build_sppe(cfg.MODEL, preset_cfg=cfg.DATA_PRESET)
+    return model.eval(), cfg
+
+
+def assert_parity(model, engine):
+    inps = torch.randn(BATCH_SIZE, 3, *IMAGE_SIZE)
+    with torch.no_grad():
+        expected = model(inps)
+        hm = engine(inps)
+    assert hm.shape == expected.shape
+    # relative to the scale of the heatmaps, which is arbitrary with random weights
+    assert torch.allclose(hm, expected, rtol=ATOL, atol=ATOL * float(expected.abs().max()))
+
+
+@pytest.mark.parametrize('name', list(CONFIGS))
+def test_torchscript_parity(name, monkeypatch, tmp_path):
+    model, cfg = build_model(name, monkeypatch)
+    path = export_torchscript(model, cfg, str(tmp_path / 'model.pt'))
+    engine = build_pose_engine(cfg, path, backend='torchscript')
+    assert engine.backend == 'torchscript'
+    assert_parity(model, engine)
+
+
+@pytest.mark.parametrize('name', list(CONFIGS))
+def test_onnx_parity(name, monkeypatch, tmp_path):
+    pytest.importorskip('onnx')
+    pytest.importorskip('onnxruntime')
+    model, cfg = build_model(name, monkeypatch)
+    path = export_onnx(model, cfg, str(tmp_path / 'model.onnx'))
+    engine = build_pose_engine(cfg, path, backend='onnx')
+    assert engine.backend == 'onnx'
+    assert_parity(model, engine)
+
+
+def test_eager_engine(monkeypatch, tmp_path):
+    model, cfg = build_model('PoseHighResolutionNet', monkeypatch)
+    path = str(tmp_path / 'model.pth')
+    torch.save(model.state_dict(), path)
+    engine = build_pose_engine(cfg, path, backend='eager')
+    assert isinstance(engine, EagerEngine)
+    assert_parity(model, engine)
+
+
+def test_incomplete_engine():
+    class NoForward(PoseEngine):
+        pass
+
+    with pytest.raises(TypeError):
+        NoForward()